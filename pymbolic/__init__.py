@@ -132,7 +132,9 @@ import pymbolic.mapper.dependency
 import pymbolic.mapper.substitutor
 import pymbolic.mapper.differentiator
 import pymbolic.mapper.distributor
+import pymbolic.mapper.expander
 import pymbolic.mapper.flattener
+import pymbolic.mapper.simplifier
 import pymbolic.primitives
 
 from pymbolic.polynomial import Polynomial  # noqa
@@ -155,6 +157,7 @@ evaluate_kw = pymbolic.mapper.evaluator.evaluate_kw
 compile = pymbolic.compiler.compile
 substitute = pymbolic.mapper.substitutor.substitute
 diff = differentiate = pymbolic.mapper.differentiator.differentiate
-expand = pymbolic.mapper.distributor.distribute
+expand = pymbolic.mapper.expander.expand
 distribute = pymbolic.mapper.distributor.distribute
 flatten = pymbolic.mapper.flattener.flatten
+simplify = pymbolic.mapper.simplifier.simplify
@@ -24,7 +24,6 @@ THE SOFTWARE.
 
 import six
 from six.moves import range, zip, reduce
-import cmath
 from pytools import memoize
 
 
@@ -90,7 +89,13 @@ def extended_euclidean(q, r):
 
 
 def gcd(q, r):
-    return extended_euclidean(q, r)[0]
+    """Return the greatest common divisor of *q* and *r*, as computed by
+    the :meth:`~pymbolic.traits.EuclideanRingTraits.gcd` of their common
+    traits. For polynomials with integer coefficients, this uses
+    :func:`pymbolic.polynomial.polynomial_gcd`.
+    """
+    import pymbolic.traits as traits
+    return traits.common_traits(q, r).gcd(q, r)
 
 
 def gcd_many(*args):
@@ -108,6 +113,45 @@ def lcm(q, r):
 # }}}
 
 
+# {{{ primes
+
+def _is_prime(n):
+    # deterministic Miller-Rabin, valid for n < 3215031751
+    if n < 2:
+        return False
+    for p in (2, 3, 5, 7):
+        if n % p == 0:
+            return n == p
+
+    d = n - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+
+    for a in (2, 3, 5, 7):
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+
+    return True
+
+
+def _iter_primes_below(n):
+    while n > 2:
+        n -= 1
+        if _is_prime(n):
+            yield n
+
+# }}}
+
+
 # {{{ fft
 
 @memoize
@@ -127,6 +171,88 @@ def find_factors(n):
     return n1, n2
 
 
+# Real and imaginary parts of FFT factors below this magnitude are rounding
+# residue and set to zero.
+FFT_NEAR_ZERO = 1e-15
+
+
+@memoize
+def _get_fft_plan(n, sign):
+    r"""Return a tuple of stages ``(radix, twiddles, dft_matrix)`` for an FFT
+    of length *n*, one per prime factor of *n*. *twiddles* holds the twiddle
+    factors applied to the input of the stage (*None* if they are all one),
+    shaped for broadcasting against the reordered output of the previous
+    stage, see :func:`fft`. *dft_matrix* is the Fourier matrix of size
+    *radix*.
+
+    Real and imaginary parts below :data:`FFT_NEAR_ZERO` in magnitude (such
+    as the real part of :math:`\exp(-i\pi/2)`) are set to zero.
+    """
+    import numpy
+
+    stages = []
+    length = 1
+    prev_radix = 1
+    while n > 1:
+        radix, n = find_factors(n)
+        new_length = radix*length
+
+        # reduce the integer exponents first to keep the factors accurate
+        if length > 1:
+            twiddles = numpy.exp(
+                    sign*(-2j)*numpy.pi/new_length
+                    * (numpy.multiply.outer(
+                        numpy.arange(radix), numpy.arange(length))
+                        % new_length))
+            twiddles = twiddles.reshape(
+                    radix, 1, prev_radix, length // prev_radix)
+        else:
+            twiddles = None
+
+        dft_matrix = numpy.exp(
+                sign*(-2j)*numpy.pi/radix
+                * (numpy.multiply.outer(
+                    numpy.arange(radix), numpy.arange(radix))
+                    % radix))
+
+        for factors in [twiddles, dft_matrix]:
+            if factors is not None:
+                factors.real[abs(factors.real) < FFT_NEAR_ZERO] = 0
+                factors.imag[abs(factors.imag) < FFT_NEAR_ZERO] = 0
+
+        stages.append((radix, twiddles, dft_matrix))
+        length = new_length
+        prev_radix = radix
+
+    return tuple(stages)
+
+
+@memoize
+def _get_object_fft_plan(n, sign):
+    """Like :func:`_get_fft_plan`, but with object arrays of Python scalars
+    (real ones where possible), so that expressions handle the
+    multiplications, and e.g. multiplication by one is free.
+    """
+    import numpy
+
+    def to_object_array(factors):
+        if factors is None:
+            return None
+
+        result = numpy.empty(factors.shape, dtype=object)
+        for i, factor in numpy.ndenumerate(factors):
+            if factor.imag == 0:
+                result[i] = float(factor.real)
+            else:
+                result[i] = complex(factor)
+
+        return result
+
+    return tuple(
+            (radix, to_object_array(twiddles), to_object_array(dft_matrix))
+            for radix, twiddles, dft_matrix in _get_fft_plan(n, sign))
+
+
 def fft(x, sign=1, wrap_intermediate=lambda x: x):
     r"""Computes the Fourier transform of x:
 
@@ -135,170 +261,718 @@ def fft(x, sign=1, wrap_intermediate=lambda x: x):
         F[x]_k = \sum_{j=0}^{n-1} z^{kj} x_j
 
     where :math:`z = \exp(-2i\pi\operatorname{sign}/n)` and ``n == len(x)``.
-    Works for all positive *n*.
+    Works for all positive *n*, and for numerical as well as object arrays
+    (e.g. of expressions).
 
-    See also `Wikipedia <http://en.wikipedia.org/wiki/Cooley-Tukey_FFT_algorithm>`_.
-    """
+    This is an iterative, self-sorting (Stockham) mixed-radix variant of the
+    `Cooley-Tukey algorithm
+    <http://en.wikipedia.org/wiki/Cooley-Tukey_FFT_algorithm>`_ with one
+    stage per prime factor of *n*. Twiddle factors are computed once per *n*
+    and *sign*, and all stages work in the same two arrays.
 
-    # revision 293076305, http://is.gd/1c7PI
-
-    from math import pi
+    :arg wrap_intermediate: applied to the vector of intermediate results
+        after the twiddle factors of each stage have been applied.
+    """
     import numpy
 
+    x = numpy.asarray(x)
     n = len(x)
 
     if n == 1:
         return x
 
-    N1, N2 = find_factors(n)  # noqa: N806
+    if x.dtype.kind in "biufc":
+        dtype = numpy.result_type(x.dtype, numpy.complex128)
+        plan = _get_fft_plan(n, sign)
+    else:
+        dtype = object
+        plan = _get_object_fft_plan(n, sign)
+
+    scaled = numpy.empty(n, dtype)
+    result = numpy.empty(n, dtype)
+
+    # After a stage of radix r that combined transforms of length l into
+    # ones of length l*r, result[k2, q, k1] holds entry k1 + l*k2 of the
+    # transform of x[q::stride].
 
-    sub_ffts = [
-            wrap_intermediate(
-                fft(x[n1::N1], sign, wrap_intermediate)
-                * numpy.exp(numpy.linspace(0, sign*(-2j)*pi*n1/N1, N2,
-                    endpoint=False)))
-            for n1 in range(N1)]
+    length = 1
+    prev_radix = 1
+    for radix, twiddles, dft_matrix in plan:
+        stride = n // (radix*length)
 
-    return numpy.hstack([
-        sum(subvec * cmath.exp(sign*(-2j)*pi*n1*k1/N1)
-            for n1, subvec in enumerate(sub_ffts))
-        for k1 in range(N1)
-        ])
+        if twiddles is None:
+            stage_input = x.reshape(radix, stride)
+        else:
+            # split q into (t, q'), where t selects one of *radix*
+            # interleaved transforms, and order the entries by
+            # (t, q', k2, k1), i.e. by (t, q', k1 + l*k2)
+            prev_result = result.reshape(
+                    prev_radix, radix, stride, length // prev_radix)
+            numpy.multiply(
+                    prev_result.transpose(1, 2, 0, 3), twiddles,
+                    out=scaled.reshape(
+                        radix, stride, prev_radix, length // prev_radix))
+
+            stage_input = numpy.asarray(
+                    wrap_intermediate(scaled)).reshape(radix, -1)
+
+        numpy.matmul(dft_matrix, stage_input, out=result.reshape(radix, -1))
+
+        length *= radix
+        prev_radix = radix
+
+    return result
 
 
 def ifft(x, wrap_intermediate=lambda x: x):
     return (1/len(x))*fft(x, -1, wrap_intermediate)
 
 
+def _wrap_in_cses(x):
+    from pymbolic.primitives import CommonSubexpression
+    import numpy
+
+    result = numpy.empty(len(x), dtype=object)
+    for i, x_i in enumerate(x):
+        result[i] = CommonSubexpression(x_i)
+    return result
+
+
+def _make_cse(children):
+    from pymbolic.primitives import CommonSubexpression
+    child, = children
+    return CommonSubexpression(child)
+
+
+@memoize
+def _get_sym_fft_program(n, sign):
+    """Return a tuple ``(constants, operations, outputs)`` describing how
+    :func:`sym_fft` builds its result from its *n* inputs.
+
+    To run it, start with a list *values* holding the inputs, followed by
+    *constants*. Each entry ``(make, args)`` of *operations* then appends
+    ``make(tuple(values[i] for i in args))`` to *values*. The results are
+    at the indices *outputs* of *values*.
+    """
+    from pymbolic.primitives import (
+            Variable, Sum, Product, CommonSubexpression)
+
+    inputs = [Variable("_fft_input_%d" % i) for i in range(n)]
+    template = fft(_wrap_in_cses(inputs), sign=sign,
+            wrap_intermediate=_wrap_in_cses)
+
+    # The template shares subexpressions by identity, so nodes are keyed by
+    # their id (while the template is alive). Operations and constants are
+    # numbered separately at first, and merged into one index space below.
+    id_to_key = dict((id(x_i), ("input", i)) for i, x_i in enumerate(inputs))
+    constants = []
+    operations = []
+
+    def linearize(expr):
+        try:
+            return id_to_key[id(expr)]
+        except KeyError:
+            pass
+
+        if isinstance(expr, CommonSubexpression):
+            operations.append((_make_cse, (linearize(expr.child),)))
+            key = ("op", len(operations) - 1)
+        elif isinstance(expr, (Sum, Product)):
+            args = tuple(linearize(child) for child in expr.children)
+            operations.append((type(expr), args))
+            key = ("op", len(operations) - 1)
+        else:
+            constants.append(expr)
+            key = ("constant", len(constants) - 1)
+
+        id_to_key[id(expr)] = key
+        return key
+
+    outputs = [linearize(template_i) for template_i in template]
+
+    base_index = {
+            "input": 0,
+            "constant": n,
+            "op": n + len(constants)}
+
+    def get_index(key):
+        kind, i = key
+        return base_index[kind] + i
+
+    return (
+            tuple(constants),
+            tuple(
+                (make, tuple(get_index(arg) for arg in args))
+                for make, args in operations),
+            tuple(get_index(output) for output in outputs))
+
+
 def sym_fft(x, sign=1):
     """Perform a (symbolic) FFT on the :mod:`numpy` object array x.
 
-    Remove near-zero floating point constants, insert
-    :class:`pymbolic.primitives.CommonSubexpression`
-    wrappers at opportune points.
-    """
+    Inserts :class:`pymbolic.primitives.CommonSubexpression` wrappers for the
+    inputs and the intermediate results of each stage, so that the result is
+    ready for code generation, e.g. by
+    :class:`pymbolic.mapper.c_code.CCodeMapper`. Near-zero floating point
+    constants do not occur in the result.
 
-    from pymbolic.mapper import IdentityMapper, CSECachingMapperMixin
-
-    class NearZeroKiller(CSECachingMapperMixin, IdentityMapper):
-        map_common_subexpression_uncached = \
-                IdentityMapper.map_common_subexpression
-
-        def map_constant(self, expr):
-            if isinstance(expr, complex):
-                r = expr.real
-                i = expr.imag
-                if abs(r) < 1e-15:
-                    r = 0
-                if abs(i) < 1e-15:
-                    i = 0
-                if i == 0:
-                    return r
-                else:
-                    return complex(r, i)
-            else:
-                return expr
+    The transform is derived only once per length and *sign*, and recorded
+    as a sequence of operations. Each call then replays these on the
+    entries of *x*.
+    """
 
     import numpy
 
-    def wrap_intermediate(x):
-        if len(x) > 1:
-            from pymbolic.primitives import CommonSubexpression
-            result = numpy.empty(len(x), dtype=object)
-            for i, x_i in enumerate(x):
-                result[i] = CommonSubexpression(x_i)
-            return result
-        else:
-            return x
+    n = len(x)
+    if n == 1:
+        return x
+
+    constants, operations, outputs = _get_sym_fft_program(n, sign)
+
+    values = list(x)
+    values.extend(constants)
+    for make, args in operations:
+        values.append(make(tuple([values[i] for i in args])))
 
-    return NearZeroKiller()(
-            fft(wrap_intermediate(x), sign=sign,
-                wrap_intermediate=wrap_intermediate))
+    result = numpy.empty(n, dtype=object)
+    for i, output in enumerate(outputs):
+        result[i] = values[output]
+
+    return result
 
 # }}}
 
 
-def csr_matrix_multiply(S, x):  # noqa
-    """Multiplies a :class:`scipy.sparse.csr_matrix` S by an object-array vector x.
+def csr_matrix_multiply(S, x, max_workers=None):  # noqa
+    """Multiplies a :class:`scipy.sparse.csr_matrix` S by a vector x.
+
+    If *x* has a numerical dtype, the product is computed by
+    :mod:`scipy.sparse`. Otherwise (e.g. for an object array of
+    expressions), each entry of the result is built as a single flattened
+    :class:`~pymbolic.primitives.Sum`.
+
+    :arg max_workers: If greater than one, blocks of rows are multiplied
+        concurrently on a thread pool with this many threads. This only
+        pays off for large matrices whose multiplication releases the global
+        interpreter lock, i.e. for numerical *x*.
     """
+    import numpy
+    x = numpy.asarray(x)
     h, w = S.shape
 
-    import numpy
-    result = numpy.empty_like(x)
+    if x.dtype.kind in "biufc":
+        def multiply_block(start, stop):
+            return S[start:stop].dot(x)
 
-    for i in range(h):
-        result[i] = sum(S.data[idx]*x[S.indices[idx]]  # noqa pylint:disable=unsupported-assignment-operation
-                for idx in range(S.indptr[i], S.indptr[i+1]))
+    else:
+        from pymbolic.primitives import Sum, is_constant, is_nonzero
 
-    return result
+        if all(is_constant(x_i) for x_i in x):
+            sum_row = sum
+        else:
+            def sum_row(terms):
+                # like flattened_sum, but the terms are known to be nonzero
+                if len(terms) == 0:
+                    return 0
+                elif len(terms) == 1:
+                    return terms[0]
+
+                children = []
+                for term in terms:
+                    if isinstance(term, Sum):
+                        children.extend(term.children)
+                    else:
+                        children.append(term)
+                return Sum(tuple(children))
+
+        # drop zero terms once and for all
+        keep = numpy.asarray(S.data) != 0
+        keep &= numpy.array([is_nonzero(x_i) for x_i in x], dtype=bool)[S.indices]
+        kept_before = numpy.concatenate([[0], numpy.cumsum(keep)])
+
+        indptr = kept_before[S.indptr]
+        data = numpy.asarray(S.data)[keep]
+        indices = S.indices[keep]
+
+        def multiply_block(start, stop):
+            block_start = indptr[start]
+            block_stop = indptr[stop]
+            products = (
+                    data[block_start:block_stop].astype(object)
+                    * x[indices[block_start:block_stop]])
+
+            result = numpy.empty(stop-start, dtype=object)
+            for i in range(start, stop):
+                result[i-start] = sum_row(products[
+                    indptr[i]-block_start:indptr[i+1]-block_start])
+            return result
+
+    if max_workers is None or max_workers <= 1 or h < 2*max_workers:
+        return multiply_block(0, h)
+
+    # a few blocks per worker, to even out the load
+    nblocks = 4*max_workers
+    bounds = [h*i//nblocks for i in range(nblocks+1)]
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        blocks = list(pool.map(multiply_block, bounds[:-1], bounds[1:]))
+
+    return numpy.concatenate(blocks)
 
 
 # {{{ gaussian elimination
 
-def gaussian_elimination(mat, rhs):
-    m, n = mat.shape
+# Modular elimination works with primes below this bound, so that products
+# of residues fit into 64-bit integers.
+MODULAR_ELIMINATION_PRIME_BOUND = 2**31
+
+# Products of two integers below this bound in magnitude, and differences of
+# such products, fit into 64-bit integers.
+_INT64_SAFE_BOUND = 2**31
+
+
+def _bareiss_rref(aug, ncols):
+    """Bring the first *ncols* columns of the integer array *aug* into
+    reduced row echelon form by fraction-free (Bareiss) Gauss-Jordan
+    elimination, applying the same row operations to the remaining columns.
+
+    Each step updates all rows at once and divides exactly by the previous
+    pivot, which keeps entries as small as the minors of *aug*. If *aug* is
+    a :class:`numpy.int64` array (whose entries must then be below
+    :data:`_INT64_SAFE_BOUND` in magnitude), entries are kept as such while
+    they are known not to overflow, and as Python integers (in an object
+    array) otherwise.
+    """
+    import numpy as np
+
+    m = aug.shape[0]
+    prev_pivot = 1
     i = 0
-    j = 0
+    for j in range(ncols):
+        if i >= m:
+            break
+
+        nonz_rows, = np.nonzero(aug[i:, j])
+        if not len(nonz_rows):
+            continue
+
+        k = i + nonz_rows[0]
+        if k != i:
+            aug[[i, k]] = aug[[k, i]]
+
+        pivot = aug[i, j]
+        col = aug[:, j].copy()
+        col[i] = 0
+        is_nonz = col != 0
+
+        rows, = np.nonzero(is_nonz)
+        aug[rows] = (
+                pivot*aug[rows] - np.outer(col[rows], aug[i])
+                ) // prev_pivot
+
+        if pivot != prev_pivot:
+            # rows that are already eliminated only need rescaling
+            is_nonz[i] = True
+            scaled_rows, = np.nonzero(~is_nonz)
+            aug[scaled_rows] = pivot*aug[scaled_rows] // prev_pivot
+            rows = slice(None)
+
+        prev_pivot = pivot
+        i += 1
+
+        if (aug.dtype != object
+                and np.abs(aug[rows]).max(initial=0) >= _INT64_SAFE_BOUND):
+            # the next step might overflow
+            aug = aug.astype(object)
+            prev_pivot = int(prev_pivot)
+
+    return aug
+
+
+def _rref_mod_p(aug, ncols, p):
+    """Bring the first *ncols* columns of the integer array *aug* into
+    reduced row echelon form (with unit pivots) modulo the prime *p*, in the
+    same way as :func:`_bareiss_rref`.
+
+    :returns: a tuple *(pivot_cols, row_order, rref)*, where *row_order*
+        lists the rows of *aug* in the order in which they appear in *rref*.
+    """
+    import numpy as np
+
+    aug = aug % p
+    m = aug.shape[0]
+    row_order = np.arange(m)
+    pivot_cols = []
+    i = 0
+    for j in range(ncols):
+        if i >= m:
+            break
+
+        nonz_rows, = np.nonzero(aug[i:, j])
+        if not len(nonz_rows):
+            continue
+
+        k = i + nonz_rows[0]
+        if k != i:
+            aug[[i, k]] = aug[[k, i]]
+            row_order[[i, k]] = row_order[[k, i]]
 
-    while i < m and j < n:
-        # {{{ find pivot in column j, starting in row i
+        aug[i] = aug[i] * pow(int(aug[i, j]), p-2, p) % p
 
-        nonz_row = None
-        for k in range(i, m):
-            if mat[k, j]:
-                nonz_row = k
+        col = aug[:, j].copy()
+        col[i] = 0
+        rows, = np.nonzero(col)
+        aug[rows] = (aug[rows] - np.outer(col[rows], aug[i])) % p
+
+        pivot_cols.append(j)
+        i += 1
+
+    return pivot_cols, row_order.tolist(), aug
+
+
+def _isqrt(n):
+    """Return the integer square root of the nonnegative :class:`int` *n*,
+    by Newton's method.
+    """
+    if n <= 0:
+        return 0
+
+    # initial guess is at least sqrt(n), iterates decrease monotonically
+    x = 1 << ((n.bit_length() + 1) // 2)
+    while True:
+        y = (x + n // x) // 2
+        if y >= x:
+            return x
+        x = y
+
+
+def _rational_reconstruction(a, modulus):
+    """Return *(num, den)* with ``num/den`` congruent to *a* modulo *modulus*
+    and both bounded by ``sqrt(modulus/2)`` in magnitude, or *None*.
+    """
+    bound = _isqrt(modulus // 2)
+    r0, r1 = modulus, a % modulus
+    s0, s1 = 0, 1
+    while r1 > bound:
+        q = r0 // r1
+        r0, r1 = r1, r0 - q*r1
+        s0, s1 = s1, s0 - q*s1
+
+    if s1 == 0 or abs(s1) > bound:
+        return None
+    if s1 < 0:
+        return -r1, -s1
+    return r1, s1
+
+
+def _modular_rref(aug, ncols):
+    """Compute the same result as :func:`_bareiss_rref` (up to the scaling
+    of rows) from reduced row echelon forms modulo several primes, combined
+    by Chinese remaindering and rational reconstruction. The result is
+    verified exactly before it is returned.
+    """
+    import numpy as np
+    from math import gcd as int_gcd
+
+    def int_lcm(a, b):
+        return a * b // int_gcd(a, b)
+
+    aug = np.array(aug, dtype=object)
+    m, n = aug.shape
+
+    signature = None
+    residues = None
+    modulus = None
+    prev_result = None
+
+    for p in _iter_primes_below(MODULAR_ELIMINATION_PRIME_BOUND):
+        pivot_cols, row_order, image = _rref_mod_p(
+                (aug % p).astype(np.int64), ncols, p)
+
+        # Modulo an unlucky prime, pivots vanish and are found further
+        # down or right than over the rationals.
+        image_signature = (-len(pivot_cols), pivot_cols, row_order)
+        if signature is not None and image_signature > signature:
+            continue
+
+        image = image.astype(object)
+        if image_signature != signature:
+            # first prime, or all previous primes were unlucky
+            signature = image_signature
+            residues = image
+            modulus = p
+            prev_result = None
+            continue
+
+        # {{{ chinese remaindering
+
+        modulus_inv = pow(modulus % p, p-2, p)
+        residues = residues + modulus * (
+                (image - residues) * modulus_inv % p)
+        modulus *= p
+
+        # }}}
+
+        # {{{ rational reconstruction into integer rows
+
+        result = np.empty((m, n), dtype=object)
+        row_scales = []
+        for i in range(m):
+            fractions = []
+            for a in residues[i]:
+                frac = _rational_reconstruction(a, modulus) if a else (0, 1)
+                if frac is None:
+                    break
+                fractions.append(frac)
+            else:
+                scale = 1
+                for num, den in fractions:
+                    scale = int_lcm(scale, den)
+                result[i] = [num * (scale // den) for num, den in fractions]
+                row_scales.append(scale)
+                continue
+
+            result = None
+            break
+
+        # }}}
+
+        if result is None or prev_result is None or not np.array_equal(
+                result, prev_result):
+            prev_result = result
+            continue
+
+        # {{{ verify
+
+        # With R_k the k-th row of the rational result, each original row a
+        # must satisfy a = sum_k a[pivot_cols[k]] R_k (+ R_i for rows i
+        # beyond the rank, which have no pivot).
+
+        rank = len(pivot_cols)
+        common_scale = 1
+        for scale in row_scales:
+            common_scale = int_lcm(common_scale, scale)
+
+        scaled_result = result * np.array(
+                [common_scale // scale for scale in row_scales],
+                dtype=object)[:, np.newaxis]
+
+        reordered_aug = aug[row_order]
+        pivot_part = reordered_aug[:, pivot_cols]
+        for i in range(m):
+            expected = common_scale*reordered_aug[i]
+            if i >= rank:
+                expected = expected - scaled_result[i]
+
+            # aug is typically sparse
+            k, = np.nonzero(pivot_part[i])
+            combination = pivot_part[i, k].dot(scaled_result[k])
+            if not np.array_equal(combination, expected):
                 break
+        else:
+            return result
 
         # }}}
 
-        if nonz_row is not None:
-            # swap rows i and nonz
-            mat[i], mat[nonz_row] = \
-                    (mat[nonz_row].copy(), mat[i].copy())
-            rhs[i], rhs[nonz_row] = \
-                    (rhs[nonz_row].copy(), rhs[i].copy())
 
-            for u in range(0, m):
-                if u == i:
-                    continue
-                if not mat[u, j]:
-                    # already 0
-                    continue
+def gaussian_elimination(mat, rhs, method="bareiss"):
+    """Bring the integer matrix *mat* into reduced row echelon form by row
+    operations, applying the same operations to the integer matrix *rhs*.
+    Each row of the result is scaled to have coprime integer entries, the
+    first nonzero one of which is positive.
 
-                ell = lcm(mat[u, j], mat[i, j])
-                u_fac = ell//mat[u, j]
-                i_fac = ell//mat[i, j]
+    :arg method: ``"bareiss"`` for fraction-free elimination, or
+        ``"modular"`` for elimination modulo several primes, with the
+        result reconstructed by Chinese remaindering. The latter avoids the
+        growth of intermediate entries, at the cost of an exact
+        verification of the result.
+    :returns: a tuple *(mat, rhs)* of :mod:`numpy` object arrays of Python
+        integers.
+    """
+    import numpy as np
 
-                mat[u] = u_fac*mat[u] - i_fac*mat[i]
-                rhs[u] = u_fac*rhs[u] - i_fac*rhs[i]
+    mat = np.asarray(mat)
+    rhs = np.asarray(rhs)
+    m, n = mat.shape
 
-                assert mat[u, j] == 0
+    aug = np.array(
+            [[int(a) for a in row] for row in np.hstack([mat, rhs])],
+            dtype=object).reshape(m, n + rhs.shape[1])
 
-            i += 1
+    if method == "bareiss":
+        if np.abs(aug).max(initial=0) < _INT64_SAFE_BOUND:
+            aug = aug.astype(np.int64)
+        aug = _bareiss_rref(aug, n).astype(object)
+    elif method == "modular":
+        aug = _modular_rref(aug, n)
+    else:
+        raise ValueError("unknown elimination method: '%s'" % method)
 
-        j += 1
+    # {{{ normalize rows
 
     for i in range(m):
-        g = gcd_many(*(
-            [a for a in mat[i] if a]
-            +  # noqa: W504
-            [a for a in rhs[i] if a]))
+        nonz, = np.nonzero(aug[i])
+        if not len(nonz):
+            continue
 
-        mat[i] //= g
-        rhs[i] //= g
+        g = np.gcd.reduce(aug[i])
+        if aug[i, nonz[0]] < 0:
+            g = -g
+        aug[i] //= g
 
-    return mat, rhs
+    # }}}
+
+    return aug[:, :n], aug[:, n:]
 
 # }}}
 
 
 # {{{ symbolic (linear) equation solving
 
-def solve_affine_equations_for(unknowns, equations):
+# Below this fraction of nonzero entries in the coefficient matrix,
+# solve_affine_equations_for uses sparse elimination.
+SPARSE_SOLVE_MAX_DENSITY = 0.2
+
+
+def _eliminate_sparse(target, pivot_row, col):
+    """Eliminate the column *col* from the row *target* using *pivot_row*,
+    in place. Rows are tuples *(coeffs, rhs)* of :class:`dict` instances
+    with integer values, and are kept primitive (i.e. with coprime entries).
+    """
+    from math import gcd as int_gcd
+
+    coeffs, rhs = target
+    pivot_coeffs, pivot_rhs = pivot_row
+
+    target_coeff = coeffs[col]
+    pivot_coeff = pivot_coeffs[col]
+    g = int_gcd(target_coeff, pivot_coeff)
+    target_fac = pivot_coeff // g
+    pivot_fac = target_coeff // g
+
+    for entries, pivot_entries in [(coeffs, pivot_coeffs), (rhs, pivot_rhs)]:
+        if target_fac != 1:
+            for key in entries:
+                entries[key] *= target_fac
+
+        for key, pivot_value in six.iteritems(pivot_entries):
+            value = entries.get(key, 0) - pivot_fac*pivot_value
+            if value:
+                entries[key] = value
+            else:
+                entries.pop(key, None)
+
+    _make_row_primitive(target)
+
+
+def _make_row_primitive(row):
+    """Divide the sparse row *row* (see :func:`_eliminate_sparse`) by the gcd
+    of its entries, in place.
+    """
+    from math import gcd as int_gcd
+
+    g = 0
+    for entries in row:
+        for value in six.itervalues(entries):
+            g = int_gcd(g, value)
+    if g > 1:
+        for entries in row:
+            for key in entries:
+                entries[key] //= g
+
+
+def _sparse_gauss_jordan(rows):
+    """Bring the sparse rows *rows* (see :func:`_eliminate_sparse`) into
+    reduced row echelon form (up to the order of rows) in place. All rows
+    are made primitive, so that a row with a single unknown (with an
+    integer solution) has a coefficient of one in magnitude, as for
+    :func:`gaussian_elimination`.
+
+    Pivots are chosen by the Markowitz criterion, i.e. to minimize the
+    product of the numbers of other entries in their row and column, which
+    limits fill-in. Among equally good pivots, ones of smaller magnitude
+    are preferred.
+    """
+    for row in rows:
+        # rows that never take part in an elimination would stay as given
+        _make_row_primitive(row)
+
+    active = set(i for i, (coeffs, rhs) in enumerate(rows) if coeffs)
+    col_to_rows = {}
+    for i in active:
+        for col in rows[i][0]:
+            col_to_rows.setdefault(col, set()).add(i)
+
+    pivots = []
+    while active:
+        # {{{ find pivot
+
+        best_cost = None
+        for i in active:
+            coeffs = rows[i][0]
+            for col, coeff in six.iteritems(coeffs):
+                cost = (
+                        (len(coeffs)-1)*(len(col_to_rows[col])-1),
+                        abs(coeff))
+                if best_cost is None or cost < best_cost:
+                    best_cost = cost
+                    pivot_idx, pivot_col = i, col
+
+            if best_cost == (0, 1):
+                # cannot do better
+                break
+
+        if best_cost is None:
+            # all remaining rows have no unknowns
+            break
+
+        # }}}
+
+        pivot_row = rows[pivot_idx]
+        active.remove(pivot_idx)
+        for col in pivot_row[0]:
+            col_to_rows[col].discard(pivot_idx)
+
+        for i in list(col_to_rows[pivot_col]):
+            coeffs = rows[i][0]
+            old_cols = set(coeffs)
+            _eliminate_sparse(rows[i], pivot_row, pivot_col)
+
+            for col in old_cols - set(coeffs):
+                col_to_rows[col].discard(i)
+            for col in set(coeffs) - old_cols:
+                col_to_rows.setdefault(col, set()).add(i)
+
+            if not coeffs:
+                active.discard(i)
+
+        pivots.append((pivot_idx, pivot_col))
+
+    # {{{ back substitution
+
+    for k in range(len(pivots)-1, -1, -1):
+        pivot_idx, pivot_col = pivots[k]
+        for i, _ in pivots[:k]:
+            if pivot_col in rows[i][0]:
+                _eliminate_sparse(rows[i], rows[pivot_idx], pivot_col)
+
+    # }}}
+
+
+def solve_affine_equations_for(unknowns, equations, method=None):
     """
     :arg unknowns: A list of variable names for which to solve.
     :arg equations: A list of tuples ``(lhs, rhs)``.
+    :arg method: ``"dense"`` to solve by :func:`gaussian_elimination`,
+        ``"sparse"`` to solve by sparse elimination on rows stored as
+        :class:`dict` instances, or *None* to choose the latter if the
+        fraction of nonzero coefficients of *unknowns* is below
+        :data:`SPARSE_SOLVE_MAX_DENSITY`.
     :return: a dict mapping unknown names to their values.
+    :raises RuntimeError: if the equations are inconsistent, or do not
+        determine the unknowns uniquely as integer combinations of the
+        parameters.
     """
     import numpy as np
 
@@ -326,48 +1000,109 @@ def solve_affine_equations_for(unknowns, equations):
     from pymbolic.mapper.coefficient import CoefficientCollector
     coeff_coll = CoefficientCollector()
 
-    # {{{ build matrix and rhs
+    # {{{ build sparse rows
 
-    mat = np.zeros((len(equations), len(unknowns_set)), dtype=object)
-    rhs_mat = np.zeros((len(equations), len(parameters)+1), dtype=object)
-
-    for i_eqn, (lhs, rhs) in enumerate(equations):
+    # one tuple (coeffs, rhs) per equation, where coeffs maps indices of
+    # unknowns and rhs maps parameters (and 1, for the constant) to their
+    # coefficients
+    rows = []
+    for lhs, rhs in equations:
+        row_coeffs = {}
+        row_rhs = {}
         for lhs_factor, coeffs in [(1, coeff_coll(lhs)), (-1, coeff_coll(rhs))]:
             for key, coeff in six.iteritems(coeffs):
                 if key in unknowns_set:
-                    mat[i_eqn, unknown_idx_lut[key]] = lhs_factor*coeff
-                elif key in parameters:
-                    rhs_mat[i_eqn, parameter_idx_lut[key]] = -lhs_factor*coeff
-                elif key == 1:
-                    rhs_mat[i_eqn, -1] = -lhs_factor*coeff
+                    entries = row_coeffs
+                    key = unknown_idx_lut[key]
+                    coeff = lhs_factor*coeff
+                elif key in parameters or key == 1:
+                    entries = row_rhs
+                    coeff = -lhs_factor*coeff
                 else:
                     raise ValueError("key '%s' not understood" % key)
 
+                entries[key] = entries.get(key, 0) + coeff
+
+        rows.append((
+            dict((k, v) for k, v in six.iteritems(row_coeffs) if v),
+            dict((k, v) for k, v in six.iteritems(row_rhs) if v)))
+
     # }}}
 
-    mat, rhs_mat = gaussian_elimination(mat, rhs_mat)
+    if method is None:
+        nnz = sum(len(coeffs) for coeffs, _ in rows)
+        if nnz < SPARSE_SOLVE_MAX_DENSITY * len(rows) * len(unknowns):
+            method = "sparse"
+        else:
+            method = "dense"
+
+    if method == "sparse":
+        _sparse_gauss_jordan(rows)
+
+    elif method == "dense":
+        mat = np.zeros((len(equations), len(unknowns_set)), dtype=object)
+        rhs_mat = np.zeros((len(equations), len(parameters)+1), dtype=object)
+
+        for i_eqn, (row_coeffs, row_rhs) in enumerate(rows):
+            for idx, coeff in six.iteritems(row_coeffs):
+                mat[i_eqn, idx] = coeff
+            for key, coeff in six.iteritems(row_rhs):
+                if key == 1:
+                    rhs_mat[i_eqn, -1] = coeff
+                else:
+                    rhs_mat[i_eqn, parameter_idx_lut[key]] = coeff
+
+        mat, rhs_mat = gaussian_elimination(mat, rhs_mat)
+
+        rows = []
+        for mat_row, rhs_row in zip(mat, rhs_mat):
+            row_rhs = dict(
+                    (parameter, coeff)
+                    for parameter, coeff in zip(parameters_list, rhs_row)
+                    if coeff)
+            if rhs_row[-1]:
+                row_rhs[1] = rhs_row[-1]
+
+            rows.append((
+                dict((idx, coeff) for idx, coeff in enumerate(mat_row)
+                    if coeff),
+                row_rhs))
+
+    else:
+        raise ValueError("unknown solution method: '%s'" % method)
 
-    # FIXME /!\ Does not check for overdetermined system.
+    # {{{ read off solution
+
+    idx_to_row = {}
+    for row_coeffs, row_rhs in rows:
+        if not row_coeffs and row_rhs:
+            raise RuntimeError("overdetermined system of equations "
+                    "has no solution")
+
+        if len(row_coeffs) == 1:
+            (idx, coeff), = six.iteritems(row_coeffs)
+            idx_to_row[idx] = coeff, row_rhs
 
     result = {}
     for j, unknown in enumerate(unknowns):
-        (nonz_row,) = np.where(mat[:, j])
-        if len(nonz_row) != 1:
+        if j not in idx_to_row:
             raise RuntimeError("cannot uniquely solve for '%s'" % unknown)
 
-        (nonz_row,) = nonz_row
-
-        if abs(mat[nonz_row, j]) != 1:
+        div, row_rhs = idx_to_row[j]
+        if abs(div) != 1:
             raise RuntimeError("division with remainder in linear solve for '%s'"
                     % unknown)
-        div = mat[nonz_row, j]
 
-        unknown_val = int(rhs_mat[nonz_row, -1]) // div
-        for parameter, coeff in zip(parameters_list, rhs_mat[nonz_row]):
-            unknown_val += (int(coeff) // div) * parameter
+        unknown_val = int(row_rhs.get(1, 0)) // div
+        for parameter in parameters_list:
+            coeff = row_rhs.get(parameter, 0)
+            if coeff:
+                unknown_val += (int(coeff) // div) * parameter
 
         result[unknown] = unknown_val
 
+    # }}}
+
     if 0:
         for lhs, rhs in equations:
             print(lhs, '=', rhs)
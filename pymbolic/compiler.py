@@ -85,6 +85,9 @@ class CompileMapper(StringifyMapper):
 
         return "numpy.array(%s)" % stringify_leading_dimension(expr)
 
+    def map_common_subexpression(self, expr, enclosing_prec):
+        return self.rec(expr.child, enclosing_prec)
+
     def map_foreign(self, expr, enclosing_prec):
         return StringifyMapper.map_foreign(self, expr, enclosing_prec)
 
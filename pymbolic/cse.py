@@ -31,22 +31,46 @@ COMMUTATIVE_CLASSES = (prim.Sum, prim.Product)
 
 
 class NormalizedKeyGetter(object):
-    def __call__(self, expr):
-        if isinstance(expr, COMMUTATIVE_CLASSES):
-            kid_count = {}
-            for child in expr.children:
-                kid_count[child] = kid_count.get(child, 0) + 1
+    """Maps expressions to hashable keys that agree for
+    :class:`~pymbolic.primitives.Sum` and :class:`~pymbolic.primitives.Product`
+    nodes that only differ in the order of their children.
 
-            return type(expr), frozenset(six.iteritems(kid_count))
-        else:
+    Keys are cached per node (by identity), so that repeated queries for
+    the same node, e.g. from :class:`UseCountMapper` and then from
+    :class:`CSEMapper`, do not rebuild the child multiset.
+    """
+
+    def __init__(self):
+        # maps id(expr) -> (expr, key). *expr* is retained so that its id
+        # cannot be reused while the cache is alive.
+        self.key_cache = {}
+
+    def __call__(self, expr):
+        if not isinstance(expr, COMMUTATIVE_CLASSES):
             return expr
 
+        try:
+            return self.key_cache[id(expr)][1]
+        except KeyError:
+            pass
+
+        kid_count = {}
+        for child in expr.children:
+            kid_count[child] = kid_count.get(child, 0) + 1
+
+        key = type(expr), frozenset(six.iteritems(kid_count))
+        self.key_cache[id(expr)] = (expr, key)
+        return key
+
 
 class UseCountMapper(WalkMapper):
     def __init__(self, get_key):
         self.subexpr_counts = {}
         self.get_key = get_key
 
+        # maps key -> first subexpression encountered with that key
+        self.key_to_subexpr = {}
+
     def visit(self, expr):
         key = self.get_key(expr)
 
@@ -57,6 +81,7 @@ class UseCountMapper(WalkMapper):
             return False
         else:
             self.subexpr_counts[key] = 1
+            self.key_to_subexpr[key] = expr
 
             # continue traversing
             return True
@@ -74,10 +99,30 @@ class UseCountMapper(WalkMapper):
 
             self.rec(expr.child)
             self.subexpr_counts[key] = 1
+            self.key_to_subexpr[key] = expr
+
+
+class _NodeCachingIdentityMapper(IdentityMapper):
+    def __init__(self):
+        # maps id(expr) -> (expr, result), see NormalizedKeyGetter.key_cache
+        self.result_cache = {}
+
+    def rec(self, expr):
+        # Map each node (by identity) only once, so that shared subtrees
+        # that are not being eliminated are not rebuilt for every use.
+        try:
+            return self.result_cache[id(expr)][1]
+        except KeyError:
+            result = IdentityMapper.rec(self, expr)
+            self.result_cache[id(expr)] = (expr, result)
+            return result
 
+    __call__ = rec
 
-class CSEMapper(IdentityMapper):
+
+class CSEMapper(_NodeCachingIdentityMapper):
     def __init__(self, to_eliminate, get_key):
+        super(CSEMapper, self).__init__()
         self.to_eliminate = to_eliminate
         self.get_key = get_key
 
@@ -129,20 +174,332 @@ class CSEMapper(IdentityMapper):
                 tuple(self.rec(v) for v in expr.values))
 
 
-def tag_common_subexpressions(exprs):
+def tag_common_subexpressions(exprs, cost_model=None, min_savings=0):
+    """Wrap subexpressions that occur more than once in *exprs* in
+    :class:`pymbolic.primitives.CommonSubexpression` nodes.
+
+    :arg exprs: an iterable of expressions.
+    :arg cost_model: a callable mapping a subexpression to its (numerical)
+        evaluation cost, for example an instance of
+        :class:`pymbolic.mapper.flop_counter.FlopCounter`. If given, a
+        subexpression used *n* times is only tagged if ``(n-1)*cost``
+        exceeds *min_savings*. If *None*, every reused subexpression is
+        tagged.
+    :returns: a list of expressions.
+    """
     get_key = NormalizedKeyGetter()
     ucm = UseCountMapper(get_key)
 
     if isinstance(exprs, prim.Expression):
         raise TypeError("exprs should be an iterable of expressions")
 
+    exprs = list(exprs)
     for expr in exprs:
         ucm(expr)
 
-    to_eliminate = set([subexpr_key
-        for subexpr_key, count in six.iteritems(ucm.subexpr_counts)
-        if count > 1])
+    to_eliminate = set()
+    for subexpr_key, count in six.iteritems(ucm.subexpr_counts):
+        if count <= 1:
+            continue
+
+        if cost_model is not None:
+            cost = cost_model(ucm.key_to_subexpr[subexpr_key])
+            if (count-1)*cost <= min_savings:
+                continue
+
+        to_eliminate.add(subexpr_key)
 
     cse_mapper = CSEMapper(to_eliminate, get_key)
     result = [cse_mapper(expr) for expr in exprs]
     return result
+
+
+# {{{ partial common subexpressions in commutative nodes
+
+class _SharedOperands(object):
+    """Stands for the combination (by *cls*) of *operands*, children
+    extracted from several commutative nodes.
+    """
+
+    def __init__(self, cls, operands):
+        self.cls = cls
+        self.operands = operands
+
+
+class CommutativeNodeCollector(WalkMapper):
+    """Collects the child multisets of all distinct (as determined by
+    *get_key*) :class:`~pymbolic.primitives.Sum` and
+    :class:`~pymbolic.primitives.Product` nodes.
+
+    .. attribute:: key_to_children
+
+        A mapping from keys to :class:`dict` instances mapping children to
+        their multiplicity.
+    """
+
+    def __init__(self, get_key):
+        self.get_key = get_key
+        self.key_to_children = {}
+        self.visited_ids = set()
+
+    def visit(self, expr):
+        if id(expr) in self.visited_ids:
+            return False
+        self.visited_ids.add(id(expr))
+
+        if isinstance(expr, COMMUTATIVE_CLASSES):
+            key = self.get_key(expr)
+            if key in self.key_to_children:
+                return False
+            self.key_to_children[key] = dict(key[1])
+
+        return True
+
+
+def _extract_shared_pairs(cls, node_children):
+    """Greedily replace pairs of children that occur together in more than
+    one of *node_children* (a list of child multisets, modified in place) by
+    :class:`_SharedOperands` instances, most frequent pair first. Shared
+    operands that end up used only within a single larger group are merged
+    into it.
+
+    :returns: the number of operations saved.
+    """
+    from heapq import heappush, heappop
+
+    ops_saved = 0
+
+    # Children that occur once in each of the same nodes are best shared
+    # all together, so each such group is extracted right away rather than
+    # pair by pair.
+    child_to_node_counts = {}
+    for inode, children in enumerate(node_children):
+        for child, count in six.iteritems(children):
+            child_to_node_counts.setdefault(child, []).append((inode, count))
+
+    nodes_to_group = {}
+    for child, node_counts in six.iteritems(child_to_node_counts):
+        if len(node_counts) > 1 and all(
+                count == 1 for _, count in node_counts):
+            nodes = tuple(inode for inode, _ in node_counts)
+            nodes_to_group.setdefault(nodes, []).append(child)
+
+    for nodes, group in six.iteritems(nodes_to_group):
+        if len(group) > 1:
+            shared = _SharedOperands(cls, group)
+            for inode in nodes:
+                children = node_children[inode]
+                for child in group:
+                    del children[child]
+                children[shared] = 1
+
+            ops_saved += (len(group) - 1)*(len(nodes) - 1)
+
+    # number of nodes in which each child occurs. Pairs including a child
+    # that occurs only once cannot be shared, so those are never formed.
+    occurrences = {}
+    for children in node_children:
+        for child in children:
+            occurrences[child] = occurrences.get(child, 0) + 1
+
+    pair_to_nodes = {}
+    for inode, children in enumerate(node_children):
+        candidates = [child for child in children if occurrences[child] > 1]
+        for i, a in enumerate(candidates):
+            if children[a] > 1:
+                pair_to_nodes.setdefault(frozenset([a]), set()).add(inode)
+            for b in candidates[i+1:]:
+                pair_to_nodes.setdefault(frozenset([a, b]), set()).add(inode)
+
+    # heap of (-node count, sequence number, pair), entries whose node
+    # count has gone stale are skipped when popped
+    heap = []
+    seq = [0]
+
+    def push(pair):
+        count = len(pair_to_nodes[pair])
+        if count > 1:
+            heappush(heap, (-count, seq[0], pair))
+            seq[0] += 1
+
+    for pair in pair_to_nodes:
+        push(pair)
+
+    # Only the pairs involving the children removed from and added to a node
+    # change, so only those are updated.
+    changed_pairs = set()
+
+    def discard_pair(pair, inode):
+        nodes = pair_to_nodes.get(pair)
+        if nodes is not None and inode in nodes:
+            nodes.remove(inode)
+            changed_pairs.add(pair)
+
+    def remove_child(inode, child):
+        children = node_children[inode]
+        if children[child] == 1:
+            del children[child]
+            occurrences[child] -= 1
+            for other in children:
+                discard_pair(frozenset([child, other]), inode)
+        else:
+            children[child] -= 1
+            if children[child] == 1:
+                discard_pair(frozenset([child]), inode)
+
+    def add_child(inode, child):
+        children = node_children[inode]
+        for other in children:
+            if occurrences[other] > 1:
+                pair = frozenset([child, other])
+                pair_to_nodes.setdefault(pair, set()).add(inode)
+                changed_pairs.add(pair)
+        children[child] = 1
+
+    # shared operands that are operands of another shared group
+    used_as_operand = set()
+
+    while heap:
+        neg_count, _, pair = heappop(heap)
+        nodes = pair_to_nodes[pair]
+        if len(nodes) != -neg_count:
+            continue
+
+        elements = list(pair)
+        left = elements[0]
+        right = elements[-1]
+
+        shared = _SharedOperands(cls, [])
+        occurrences[shared] = len(nodes)
+
+        changed_pairs.clear()
+        for inode in list(nodes):
+            remove_child(inode, left)
+            remove_child(inode, right)
+            add_child(inode, shared)
+
+        for operand in [left, right]:
+            if (left is not right
+                    and isinstance(operand, _SharedOperands)
+                    and not occurrences[operand]
+                    and operand not in used_as_operand):
+                # not used anywhere else, no need to keep it separate
+                shared.operands.extend(operand.operands)
+            else:
+                shared.operands.append(operand)
+                if isinstance(operand, _SharedOperands):
+                    used_as_operand.add(operand)
+
+        # one operation per node is replaced by a single shared one
+        ops_saved += -neg_count - 1
+
+        for changed_pair in changed_pairs:
+            push(changed_pair)
+
+    return ops_saved
+
+
+class PartialCSEMapper(_NodeCachingIdentityMapper):
+    """Rebuilds :class:`~pymbolic.primitives.Sum` and
+    :class:`~pymbolic.primitives.Product` nodes from the child multisets in
+    *key_to_children*, in which shared groups of children are represented by
+    placeholders. Each shared group becomes a
+    :class:`~pymbolic.primitives.CommonSubexpression`.
+    """
+
+    def __init__(self, key_to_children, get_key):
+        super(PartialCSEMapper, self).__init__()
+        self.key_to_children = key_to_children
+        self.get_key = get_key
+
+        self.shared_operands_to_cse = {}
+
+    def map_shared_operands(self, shared):
+        try:
+            return self.shared_operands_to_cse[shared]
+        except KeyError:
+            pass
+
+        operands = tuple(
+                self.map_shared_operands(operand)
+                if isinstance(operand, _SharedOperands)
+                else self.rec(operand)
+                for operand in shared.operands)
+
+        if shared.cls is prim.Sum:
+            result = prim.flattened_sum(operands)
+        else:
+            result = prim.flattened_product(operands)
+
+        result = prim.wrap_in_cse(result)
+        self.shared_operands_to_cse[shared] = result
+        return result
+
+    def map_sum(self, expr):
+        try:
+            children = self.key_to_children[self.get_key(expr)]
+        except KeyError:
+            return getattr(IdentityMapper, expr.mapper_method)(self, expr)
+
+        # Keep the remaining original children in their original order,
+        # followed by the shared groups.
+        remaining = dict(children)
+        new_children = []
+        for child in expr.children:
+            if remaining.get(child, 0):
+                remaining[child] -= 1
+                new_children.append(self.rec(child))
+
+        for child, count in six.iteritems(remaining):
+            if isinstance(child, _SharedOperands):
+                new_children.extend(count*[self.map_shared_operands(child)])
+
+        if isinstance(expr, prim.Sum):
+            return prim.flattened_sum(new_children)
+        else:
+            return prim.flattened_product(new_children)
+
+    map_product = map_sum
+
+
+def tag_common_partial_subexpressions(exprs):
+    """Find pairs of children shared among several
+    :class:`~pymbolic.primitives.Sum` or :class:`~pymbolic.primitives.Product`
+    nodes in *exprs* and compute each such pair only once, as a
+    :class:`pymbolic.primitives.CommonSubexpression`. For example, the
+    products in ``a*b*c`` and ``a*b*d`` share ``a*b``.
+
+    Children occurring once in each of the same nodes are extracted together.
+    Beyond that, pairs are extracted greedily, most frequently shared first.
+    Since extracted pairs may themselves be part of further pairs, this
+    discovers larger shared sub-multisets as well, each of which is
+    computed by a single CSE. Like :func:`tag_common_subexpressions`,
+    this assumes that addition and multiplication are commutative.
+
+    :arg exprs: an iterable of expressions.
+    :returns: a tuple ``(result, ops_saved)``, where *result* is a list of
+        expressions and *ops_saved* is the number of additions and
+        multiplications saved, counting each distinct node once.
+    """
+    if isinstance(exprs, prim.Expression):
+        raise TypeError("exprs should be an iterable of expressions")
+
+    exprs = list(exprs)
+
+    get_key = NormalizedKeyGetter()
+    collector = CommutativeNodeCollector(get_key)
+    for expr in exprs:
+        collector(expr)
+
+    ops_saved = 0
+    for cls in COMMUTATIVE_CLASSES:
+        ops_saved += _extract_shared_pairs(cls, [
+            children
+            for (key_cls, _), children in six.iteritems(
+                collector.key_to_children)
+            if key_cls is cls])
+
+    mapper = PartialCSEMapper(collector.key_to_children, get_key)
+    return [mapper(expr) for expr in exprs], ops_saved
+
+# }}}
@@ -24,13 +24,203 @@ THE SOFTWARE.
 
 
 def get_all_used_insn_ids(insn_stream):
+    if isinstance(insn_stream, StatementIndex):
+        return insn_stream.get_all_used_ids()
+
     return frozenset(insn.id for insn in insn_stream)
 
 
 def get_all_used_identifiers(insn_stream):
+    if isinstance(insn_stream, StatementIndex):
+        return set(insn_stream.get_all_used_identifiers())
+
     result = set()
     for insn in insn_stream:
         result |= insn.get_read_variables()
         result |= insn.get_written_variables()
 
     return result
+
+
+def get_topological_order(statements):
+    """Return *statements* as a list ordered such that each statement
+    follows all statements it depends on. Among statements whose
+    dependencies are satisfied, the order of *statements* is kept.
+    Dependencies on statement ids not present in *statements* are ignored.
+
+    :raises ValueError: if the dependencies contain a cycle.
+    """
+    from collections import deque
+
+    statements = list(statements)
+    id_to_stmt = dict((stmt.id, stmt) for stmt in statements)
+
+    nunsatisfied_deps = {}
+    dependents = {}
+    for stmt in statements:
+        deps = [dep for dep in stmt.depends_on if dep in id_to_stmt]
+        nunsatisfied_deps[stmt.id] = len(deps)
+        for dep in deps:
+            dependents.setdefault(dep, []).append(stmt.id)
+
+    queue = deque(
+            stmt.id for stmt in statements if not nunsatisfied_deps[stmt.id])
+
+    result = []
+    while queue:
+        stmt_id = queue.popleft()
+        result.append(id_to_stmt[stmt_id])
+
+        for dependent in dependents.get(stmt_id, ()):
+            nunsatisfied_deps[dependent] -= 1
+            if not nunsatisfied_deps[dependent]:
+                queue.append(dependent)
+
+    if len(result) != len(statements):
+        raise ValueError("dependency cycle among statements '%s'"
+                % ", ".join(sorted(
+                    stmt_id for stmt_id, count in nunsatisfied_deps.items()
+                    if count)))
+
+    return result
+
+
+class StatementIndex(object):
+    """An index of a stream of statements, providing lookup of statements by
+    id and of the statements reading and writing each variable. The read and
+    written variables of each statement are only determined once, when the
+    statement is added. The index may be updated incrementally.
+
+    All statements must have distinct ids that are not *None*.
+
+    Iterating over the index yields the statements in the order in which they
+    were added. Instances may be passed to :func:`get_all_used_insn_ids` and
+    :func:`get_all_used_identifiers`, which then do not need to rescan the
+    statements.
+
+    .. attribute:: id_to_statement
+
+        A :class:`dict` mapping statement ids to statements.
+
+    .. attribute:: variable_to_readers
+
+        A :class:`dict` mapping variable names to :class:`set` instances of
+        the ids of the statements reading them.
+
+    .. attribute:: variable_to_writers
+
+        A :class:`dict` mapping variable names to :class:`set` instances of
+        the ids of the statements writing them.
+
+    .. automethod:: add
+    .. automethod:: remove
+    .. automethod:: replace
+    .. automethod:: get_read_variables
+    .. automethod:: get_written_variables
+    .. automethod:: get_all_used_ids
+    .. automethod:: get_all_used_identifiers
+    """
+
+    def __init__(self, statements=()):
+        self.id_to_statement = {}
+        self.variable_to_readers = {}
+        self.variable_to_writers = {}
+
+        self._id_to_read_variables = {}
+        self._id_to_written_variables = {}
+
+        # maps identifiers to the number of statements using them
+        self._identifier_use_counts = {}
+
+        for stmt in statements:
+            self.add(stmt)
+
+    def __len__(self):
+        return len(self.id_to_statement)
+
+    def __iter__(self):
+        return iter(self.id_to_statement.values())
+
+    def __contains__(self, stmt_id):
+        return stmt_id in self.id_to_statement
+
+    def __getitem__(self, stmt_id):
+        return self.id_to_statement[stmt_id]
+
+    def _index(self, stmt):
+        read_vars = stmt.get_read_variables()
+        written_vars = stmt.get_written_variables()
+
+        self._id_to_read_variables[stmt.id] = read_vars
+        self._id_to_written_variables[stmt.id] = written_vars
+
+        for var_name in read_vars:
+            self.variable_to_readers.setdefault(var_name, set()).add(stmt.id)
+        for var_name in written_vars:
+            self.variable_to_writers.setdefault(var_name, set()).add(stmt.id)
+
+        for var_name in read_vars | written_vars:
+            self._identifier_use_counts[var_name] = \
+                    self._identifier_use_counts.get(var_name, 0) + 1
+
+    def _unindex(self, stmt_id):
+        read_vars = self._id_to_read_variables.pop(stmt_id)
+        written_vars = self._id_to_written_variables.pop(stmt_id)
+
+        for var_to_stmts, var_names in [
+                (self.variable_to_readers, read_vars),
+                (self.variable_to_writers, written_vars)]:
+            for var_name in var_names:
+                stmt_ids = var_to_stmts[var_name]
+                stmt_ids.remove(stmt_id)
+                if not stmt_ids:
+                    del var_to_stmts[var_name]
+
+        for var_name in read_vars | written_vars:
+            count = self._identifier_use_counts[var_name] - 1
+            if count:
+                self._identifier_use_counts[var_name] = count
+            else:
+                del self._identifier_use_counts[var_name]
+
+    def add(self, stmt):
+        """Add *stmt* to the index.
+
+        :raises ValueError: if *stmt* has no id, or if a statement with the
+            same id is already present.
+        """
+        if stmt.id is None:
+            raise ValueError("cannot index statement without an id")
+        if stmt.id in self.id_to_statement:
+            raise ValueError("duplicate statement id '%s'" % stmt.id)
+
+        self.id_to_statement[stmt.id] = stmt
+        self._index(stmt)
+
+    def remove(self, stmt_id):
+        """Remove the statement with id *stmt_id* from the index and return
+        it.
+        """
+        stmt = self.id_to_statement.pop(stmt_id)
+        self._unindex(stmt_id)
+        return stmt
+
+    def replace(self, stmt):
+        """Replace the statement with the same id as *stmt* by *stmt*,
+        keeping its position in the iteration order.
+        """
+        self._unindex(stmt.id)
+        self.id_to_statement[stmt.id] = stmt
+        self._index(stmt)
+
+    def get_read_variables(self, stmt_id):
+        return self._id_to_read_variables[stmt_id]
+
+    def get_written_variables(self, stmt_id):
+        return self._id_to_written_variables[stmt_id]
+
+    def get_all_used_ids(self):
+        return frozenset(self.id_to_statement)
+
+    def get_all_used_identifiers(self):
+        return frozenset(self._identifier_use_counts)
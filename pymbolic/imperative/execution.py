@@ -0,0 +1,198 @@
+"""Execution of statement streams"""
+
+__copyright__ = "Copyright (C) 2020 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# {{{ compiled statements
+
+def _compile_expression(expr):
+    from pymbolic.compiler import CompileMapper
+    from pymbolic.mapper.stringifier import PREC_NONE
+    expr_s = CompileMapper()(expr, PREC_NONE)
+    return compile(expr_s, "<pymbolic expression>", "eval")
+
+
+class _CompiledStatement(object):
+    def __init__(self, stmt):
+        from pymbolic.primitives import Variable, Subscript
+        from pymbolic.imperative.statement import Assignment, Nop
+
+        self.id = stmt.id
+
+        if isinstance(stmt, Nop):
+            self.lhs_name = None
+            return
+
+        if not isinstance(stmt, Assignment):
+            raise ValueError("cannot execute statement of type '%s'"
+                    % type(stmt).__name__)
+
+        condition = getattr(stmt, "condition", True)
+        if condition is True:
+            self.condition = None
+        else:
+            self.condition = _compile_expression(condition)
+
+        self.rhs = _compile_expression(stmt.rhs)
+
+        if isinstance(stmt.lhs, Variable):
+            self.lhs_name = stmt.lhs.name
+            self.lhs_index = None
+        elif (isinstance(stmt.lhs, Subscript)
+                and isinstance(stmt.lhs.aggregate, Variable)):
+            self.lhs_name = stmt.lhs.aggregate.name
+            self.lhs_index = _compile_expression(stmt.lhs.index)
+        else:
+            raise ValueError("unexpected type of LHS in statement '%s'"
+                    % stmt.id)
+
+    def __call__(self, global_dict, env):
+        if self.lhs_name is None:
+            return
+
+        if (self.condition is not None
+                and not eval(self.condition, global_dict, env)):
+            return
+
+        value = eval(self.rhs, global_dict, env)
+
+        if self.lhs_index is None:
+            env[self.lhs_name] = value
+        else:
+            env[self.lhs_name][eval(self.lhs_index, global_dict, env)] = value
+
+# }}}
+
+
+# {{{ executor
+
+class StatementExecutor(object):
+    """Executes a stream of
+    :class:`~pymbolic.imperative.statement.Assignment`,
+    :class:`~pymbolic.imperative.statement.ConditionalAssignment` and
+    :class:`~pymbolic.imperative.statement.Nop` statements.
+
+    All expressions are compiled to Python bytecode once, upon construction.
+    Statements are executed in an order consistent with their
+    :attr:`~pymbolic.imperative.statement.Statement.depends_on`, which must
+    therefore capture all ordering constraints among them (including
+    write-after-read ones). Assignments to subscripts modify the subscripted
+    object (e.g. a :mod:`numpy` array) in place.
+
+    :arg functions: a mapping from names to objects (typically functions)
+        that expressions may refer to, in addition to :mod:`math` and, if
+        available, :mod:`numpy`.
+    :arg max_workers: If greater than one, statements that do not depend on
+        each other are executed concurrently on a thread pool with this many
+        threads. This only pays off for statements whose evaluation releases
+        the global interpreter lock, such as operations on large :mod:`numpy`
+        arrays.
+
+    .. attribute:: timings
+
+        A :class:`dict` mapping statement ids to the wall time (in seconds)
+        spent executing them in the most recent call.
+
+    .. automethod:: __call__
+    """
+
+    def __init__(self, statements, functions=None, max_workers=None):
+        from pymbolic.imperative.schedule import get_wavefronts
+        self.wavefronts = [
+                [_CompiledStatement(stmt) for stmt in wavefront]
+                for wavefront in get_wavefronts(statements)]
+
+        self.global_dict = {"math": math}
+        try:
+            import numpy
+        except ImportError:
+            pass
+        else:
+            self.global_dict["numpy"] = numpy
+
+        if functions is not None:
+            self.global_dict.update(functions)
+
+        self.max_workers = max_workers
+        self.timings = {}
+
+    def _run(self, compiled_stmt, env):
+        from time import time
+        start = time()
+        compiled_stmt(self.global_dict, env)
+        elapsed = time() - start
+
+        self.timings[compiled_stmt.id] = elapsed
+        logger.debug("statement '%s' took %g s", compiled_stmt.id, elapsed)
+
+    def __call__(self, context):
+        """Execute the statements.
+
+        :arg context: a mapping from variable names to their values
+            before execution.
+        :returns: a new :class:`dict` mapping variable names to their values
+            after execution.
+        """
+        env = dict(context)
+        self.timings = {}
+
+        if self.max_workers is None or self.max_workers <= 1:
+            for wavefront in self.wavefronts:
+                for compiled_stmt in wavefront:
+                    self._run(compiled_stmt, env)
+
+            return env
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for wavefront in self.wavefronts:
+                if len(wavefront) == 1:
+                    self._run(wavefront[0], env)
+                    continue
+
+                futures = [
+                        pool.submit(self._run, compiled_stmt, env)
+                        for compiled_stmt in wavefront]
+                for future in futures:
+                    # re-raises exceptions from the workers
+                    future.result()
+
+        return env
+
+# }}}
+
+
+def execute_statements(statements, context, functions=None, max_workers=None):
+    """Execute *statements* once, see :class:`StatementExecutor`.
+
+    :returns: a new :class:`dict` mapping variable names to their values
+        after execution.
+    """
+    return StatementExecutor(statements, functions, max_workers)(context)
+
+# vim: foldmethod=marker
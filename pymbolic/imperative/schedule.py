@@ -0,0 +1,131 @@
+"""Scheduling of statement streams"""
+
+__copyright__ = "Copyright (C) 2020 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+# {{{ cost
+
+def count_statement_flops(stmt):
+    """Return the number of floating point operations needed to evaluate all
+    expressions contained in *stmt*, as counted by
+    :class:`pymbolic.mapper.flop_counter.FlopCounter`.
+    """
+    from pymbolic.mapper.flop_counter import FlopCounter
+    flop_counter = FlopCounter()
+
+    flops = []
+
+    def count(expr):
+        flops.append(flop_counter(expr))
+        return expr
+
+    stmt.map_expressions(count)
+    return sum(flops)
+
+# }}}
+
+
+# {{{ wavefronts
+
+def get_wavefronts(statements):
+    """Group *statements* into wavefronts, i.e. a list of lists of
+    statements, such that each statement only depends on statements in
+    earlier wavefronts. Statements within a wavefront are independent of
+    each other and may be executed concurrently. Each statement is placed in
+    the earliest possible wavefront.
+
+    Dependencies on statement ids not present in *statements* are ignored.
+
+    :raises ValueError: if the dependencies contain a cycle.
+    """
+    from pymbolic.imperative.analysis import get_topological_order
+
+    id_to_level = {}
+    wavefronts = []
+    for stmt in get_topological_order(statements):
+        level = 1 + max(
+                (id_to_level[dep] for dep in stmt.depends_on
+                    if dep in id_to_level),
+                default=-1)
+
+        id_to_level[stmt.id] = level
+        if level == len(wavefronts):
+            wavefronts.append([])
+        wavefronts[level].append(stmt)
+
+    return wavefronts
+
+# }}}
+
+
+# {{{ critical path
+
+def get_critical_path(statements, cost=count_statement_flops):
+    """Find the critical path through the dependency graph of *statements*,
+    i.e. the chain of dependent statements with the largest total cost. No
+    execution of *statements* can take less time than that of its critical
+    path, irrespective of the number of workers.
+
+    :arg cost: a function mapping a statement to its (numerical) cost.
+    :returns: a tuple ``(total_cost, stmt_ids)``, where *stmt_ids* is a list
+        of the ids of the statements along the critical path, in order of
+        execution.
+
+    :raises ValueError: if the dependencies contain a cycle.
+    """
+    from pymbolic.imperative.analysis import get_topological_order
+
+    # maps each id to the cost of the most costly chain ending in it, and to
+    # the predecessor along that chain
+    id_to_finish = {}
+    id_to_pred = {}
+
+    for stmt in get_topological_order(statements):
+        pred = None
+        start = 0
+        for dep in stmt.depends_on:
+            if dep in id_to_finish and (
+                    pred is None or id_to_finish[dep] > start):
+                pred = dep
+                start = id_to_finish[dep]
+
+        id_to_finish[stmt.id] = start + cost(stmt)
+        id_to_pred[stmt.id] = pred
+
+    if not id_to_finish:
+        return 0, []
+
+    stmt_id = max(id_to_finish, key=id_to_finish.__getitem__)
+    total_cost = id_to_finish[stmt_id]
+
+    path = []
+    while stmt_id is not None:
+        path.append(stmt_id)
+        stmt_id = id_to_pred[stmt_id]
+
+    return total_cost, path[::-1]
+
+# }}}
+
+
+# vim: foldmethod=marker
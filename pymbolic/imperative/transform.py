@@ -26,10 +26,11 @@ THE SOFTWARE.
 # {{{ fuse statement streams
 
 def fuse_statement_streams_with_unique_ids(statements_a, statements_b):
-    new_statements = list(statements_a)
+    from pymbolic.imperative.analysis import get_all_used_insn_ids
     from pytools import UniqueNameGenerator
-    stmt_id_gen = UniqueNameGenerator(
-            set([stmta.id for stmta in new_statements]))
+    stmt_id_gen = UniqueNameGenerator(set(get_all_used_insn_ids(statements_a)))
+
+    new_statements = list(statements_a)
 
     b_unique_statements = []
     old_b_id_to_new_b_id = {}
@@ -101,15 +102,304 @@ def disambiguate_identifiers(statements_a, statements_b,
 
 def disambiguate_and_fuse(statements_a, statements_b,
         should_disambiguate_name=None):
-    statements_b, subst_b = disambiguate_identifiers(
-            statements_a, statements_b,
-            should_disambiguate_name)
+    fused, substs, id_maps = disambiguate_and_fuse_many(
+            [statements_a, statements_b], should_disambiguate_name)
+
+    return fused, substs[1], id_maps[1]
+
+
+def disambiguate_and_fuse_many(statement_streams, should_disambiguate_name=None):
+    """Fuse any number of statement streams into a single one.
+
+    The first stream is kept as is. In each subsequent stream, identifiers
+    also used by an earlier stream are renamed (if *should_disambiguate_name*
+    returns *True* for them), as are statement ids that clash with those of
+    earlier streams. All streams share a single generator of unique names,
+    and each statement is rewritten with a single substitution, so that
+    fusing many streams takes time linear in their total size.
+
+    Streams may be given as
+    :class:`~pymbolic.imperative.analysis.StatementIndex` instances, whose
+    used identifiers and ids are then not rescanned.
+
+    :returns: a tuple ``(fused, substs, id_maps)``, where *fused* is a list of
+        statements, and ``substs[i]`` and ``id_maps[i]`` respectively map the
+        renamed identifiers of the *i*-th stream to their new
+        :class:`~pymbolic.primitives.Variable` and the statement ids of the
+        *i*-th stream to their new ids.
+    """
+    if should_disambiguate_name is None:
+        def should_disambiguate_name(name):  # pylint:disable=function-redefined
+            return True
+
+    from pymbolic.imperative.analysis import (
+            get_all_used_identifiers, get_all_used_insn_ids)
+    from pymbolic.mapper.substitutor import (
+            make_subst_func, SubstitutionMapper)
+    from pymbolic import var
+    from pytools import UniqueNameGenerator
+
+    statement_streams = list(statement_streams)
+    if not statement_streams:
+        return [], [], []
+
+    stream_identifiers = [
+            get_all_used_identifiers(stmts) for stmts in statement_streams]
+
+    vng = UniqueNameGenerator(set().union(*stream_identifiers))
+    seen_identifiers = set(stream_identifiers[0])
+
+    stmt_id_gen = UniqueNameGenerator(
+            set(get_all_used_insn_ids(statement_streams[0])))
+
+    fused = list(statement_streams[0])
+    substs = [{}]
+    id_maps = [dict((stmt.id, stmt.id) for stmt in fused)]
+
+    for stmts, identifiers in zip(statement_streams[1:], stream_identifiers[1:]):
+        subst = {}
+        for clash in identifiers & seen_identifiers:
+            if should_disambiguate_name(clash):
+                subst[clash] = var(vng(clash))
+        seen_identifiers.update(identifiers)
+
+        stmts = list(stmts)
+        id_map = dict((stmt.id, stmt_id_gen(stmt.id)) for stmt in stmts)
+
+        if subst:
+            subst_map = SubstitutionMapper(make_subst_func(subst))
+        else:
+            subst_map = None
+
+        for stmt in stmts:
+            if subst_map is not None:
+                stmt = stmt.map_expressions(subst_map)
+
+            fused.append(stmt.copy(
+                id=id_map[stmt.id],
+                depends_on=frozenset(
+                    id_map.get(dep_id, dep_id) for dep_id in stmt.depends_on)))
+
+        substs.append(subst)
+        id_maps.append(id_map)
+
+    return fused, substs, id_maps
+
+# }}}
+
+
+# {{{ eliminate_common_subexpressions
+
+def eliminate_common_subexpressions(statements):
+    """Reuse values computed by earlier assignments in later assignments with
+    the same right-hand side.
+
+    *statements* are processed in the given order, which is assumed to be an
+    order of execution consistent with their dependencies. An
+    :class:`~pymbolic.imperative.statement.Assignment` whose right-hand side
+    matches (up to reordering of the operands of a top-level sum or product)
+    one previously assigned to a variable *y* is rewritten to read *y*
+    instead, as long as neither *y* nor any of the variables read by the
+    right-hand side has been written in the meantime. The rewritten
+    assignment is made to depend on the one that assigned *y*.
+
+    Only unconditional assignments to (unsubscripted) variables make their
+    values available for reuse, but any assignment may reuse a value.
+
+    :returns: a new list of statements.
+    """
+    from pymbolic.primitives import Variable, Leaf, is_constant
+    from pymbolic.imperative.statement import Assignment
+    from pymbolic.cse import NormalizedKeyGetter
+    get_key = NormalizedKeyGetter()
+
+    # maps rhs keys to (id, variable) of the assignment that computed them
+    available = {}
+    # maps variable names to the rhs keys that are invalidated by a write
+    var_to_keys = {}
+
+    result = []
+    for stmt in statements:
+        if isinstance(stmt, Assignment):
+            key = get_key(stmt.rhs)
+            if key in available:
+                src_id, holder = available[key]
+
+                new_depends_on = stmt.depends_on
+                if src_id is not None:
+                    new_depends_on = new_depends_on | frozenset([src_id])
+
+                stmt = stmt.copy(rhs=holder, depends_on=new_depends_on)
+
+        for written_var in stmt.get_written_variables():
+            for key in var_to_keys.pop(written_var, ()):
+                available.pop(key, None)
+
+        if (isinstance(stmt, Assignment)
+                and getattr(stmt, "condition", True) is True
+                and isinstance(stmt.lhs, Variable)
+                and not isinstance(stmt.rhs, Leaf)
+                and not is_constant(stmt.rhs)):
+            read_vars = frozenset(
+                    dep.name for dep in stmt.get_dependency_mapper()(stmt.rhs))
+
+            if stmt.lhs.name not in read_vars:
+                key = get_key(stmt.rhs)
+                available[key] = (stmt.id, stmt.lhs)
+                for var_name in read_vars | frozenset([stmt.lhs.name]):
+                    var_to_keys.setdefault(var_name, set()).add(key)
+
+        result.append(stmt)
+
+    return result
+
+# }}}
+
+
+# {{{ eliminate_dead_statements
+
+def eliminate_dead_statements(statements, live_variables):
+    """Remove statements whose results cannot contribute to the values of
+    *live_variables*.
+
+    A statement is kept if it writes a variable that is either in
+    *live_variables* or read by another kept statement. Statements that do
+    not write any variables (such as
+    :class:`~pymbolic.imperative.statement.Nop`) are always kept.
+    Dependencies on removed statements are replaced by the dependencies of
+    the removed statements, so that the ordering among the remaining
+    statements is preserved.
+
+    All statements must have distinct ids that are not *None*.
+
+    :arg live_variables: an iterable of variable names whose values are
+        needed after *statements* have executed.
+    :returns: a new list of statements, in the order of *statements*.
+    :raises ValueError: if a statement has no id, or if ids are not unique.
+    """
+    from pymbolic.imperative.analysis import (
+            StatementIndex, get_topological_order)
+
+    statements = list(statements)
+    index = StatementIndex(statements)
+
+    live_vars = set(live_variables)
+    live_ids = set()
+    queue = list(live_vars)
+
+    def mark_live(stmt_id):
+        live_ids.add(stmt_id)
+        for var_name in index.get_read_variables(stmt_id):
+            if var_name not in live_vars:
+                live_vars.add(var_name)
+                queue.append(var_name)
+
+    for stmt in statements:
+        if not index.get_written_variables(stmt.id):
+            mark_live(stmt.id)
+
+    while queue:
+        var_name = queue.pop()
+        for stmt_id in index.variable_to_writers.get(var_name, ()):
+            if stmt_id not in live_ids:
+                mark_live(stmt_id)
+
+    # {{{ reroute dependencies on removed statements
+
+    dead_ids = set(
+            stmt.id for stmt in statements if stmt.id not in live_ids)
+    dead_id_to_deps = {}
+
+    def resolve_deps(depends_on):
+        result = set()
+        for dep in depends_on:
+            if dep in dead_ids:
+                result.update(dead_id_to_deps[dep])
+            else:
+                result.add(dep)
+        return frozenset(result)
+
+    for stmt in get_topological_order(statements):
+        if stmt.id in dead_ids:
+            dead_id_to_deps[stmt.id] = resolve_deps(stmt.depends_on)
+
+    # }}}
+
+    return [
+            stmt.copy(depends_on=resolve_deps(stmt.depends_on))
+            for stmt in statements
+            if stmt.id in live_ids]
+
+# }}}
 
-    fused, old_b_id_to_new_b_id = \
-            fuse_statement_streams_with_unique_ids(
-                    statements_a, statements_b)
 
-    return fused, subst_b, old_b_id_to_new_b_id
+# {{{ remove_redundant_dependencies
+
+def remove_redundant_dependencies(statements):
+    """Return a new list of statements in which each statement only keeps
+    those dependencies that are not already implied by its other
+    dependencies, i.e. compute the transitive reduction of the dependency
+    graph. Dependencies on statement ids not present in *statements* are
+    kept unchanged.
+
+    Reachability is tracked as bit masks over only those statements that are
+    among several dependencies of some statement, as only these can be
+    redundant. A mask is dropped once all statements depending on its
+    statement have been processed. So for a chain of *n* statements, each
+    adding a shortcut over its predecessor, time is :math:`O(n^2/w)` for a
+    machine word size of *w* bits, but memory is only :math:`O(n)`.
+    """
+    statements = list(statements)
+
+    from pymbolic.imperative.analysis import get_topological_order
+    ordered = get_topological_order(statements)
+
+    id_to_deps = {}
+    nremaining_dependents = {}
+    candidates = set()
+    for stmt in ordered:
+        deps = [dep for dep in stmt.depends_on if dep in nremaining_dependents]
+        id_to_deps[stmt.id] = deps
+        nremaining_dependents[stmt.id] = 0
+        for dep in deps:
+            nremaining_dependents[dep] += 1
+
+        if len(deps) > 1:
+            candidates.update(deps)
+
+    id_to_bit = dict(
+            (stmt.id, 1 << i)
+            for i, stmt in enumerate(
+                stmt for stmt in ordered if stmt.id in candidates))
+
+    # bit masks of all direct and indirect dependencies of each statement
+    # that still has unprocessed dependents
+    id_to_reachable = {}
+    id_to_new_depends_on = {}
+    for stmt in ordered:
+        deps = id_to_deps[stmt.id]
+
+        indirect = 0
+        reachable = 0
+        for dep in deps:
+            indirect |= id_to_reachable[dep]
+            reachable |= id_to_reachable[dep] | id_to_bit.get(dep, 0)
+
+        id_to_new_depends_on[stmt.id] = frozenset(
+                dep for dep in stmt.depends_on
+                if not id_to_bit.get(dep, 0) & indirect)
+
+        if nremaining_dependents[stmt.id]:
+            id_to_reachable[stmt.id] = reachable
+
+        for dep in deps:
+            nremaining_dependents[dep] -= 1
+            if not nremaining_dependents[dep]:
+                del id_to_reachable[dep]
+
+    return [
+            stmt.copy(depends_on=id_to_new_depends_on[stmt.id])
+            for stmt in statements]
 
 # }}}
 
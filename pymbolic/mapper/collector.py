@@ -26,6 +26,7 @@ THE SOFTWARE.
 
 import pymbolic
 from pymbolic.mapper import IdentityMapper
+from pymbolic.primitives import Product, Power, AlgebraicLeaf, is_constant
 
 
 class TermCollector(IdentityMapper):
@@ -39,33 +40,51 @@ class TermCollector(IdentityMapper):
     def __init__(self, parameters=set()):
         self.parameters = parameters
 
-    def get_dependencies(self, expr):
-        from pymbolic.mapper.dependency import DependencyMapper
-        return DependencyMapper()(expr)
+        # Bases of factors are interned as small integers, which serve as
+        # (part of) the keys for term collection. Whether a base depends only
+        # on parameters is determined once, upon interning.
+        self.base_to_id = {}
+        self.id_to_base = []
+        self.base_id_is_coefficient = []
 
-    def split_term(self, mul_term):
-        """Returns  a pair consisting of:
-        - a frozenset of (base, exponent) pairs
-        - a product of coefficients (i.e. constants and parameters)
+        self.exponent_is_coefficient = {}
 
-        The set takes care of order-invariant comparison for us and is hashable.
+        from pymbolic.mapper.dependency import CachedDependencyMapper
+        self.dependency_mapper = CachedDependencyMapper()
 
-        The argument `product' has to be fully expanded already.
+    def get_dependencies(self, expr):
+        return self.dependency_mapper(expr)
+
+    def get_base_id(self, base):
+        try:
+            return self.base_to_id[base]
+        except KeyError:
+            base_id = len(self.id_to_base)
+            self.base_to_id[base] = base_id
+            self.id_to_base.append(base)
+            self.base_id_is_coefficient.append(
+                    self.get_dependencies(base) <= self.parameters)
+            return base_id
+
+    def is_coefficient_exponent(self, exp):
+        if is_constant(exp):
+            return True
+
+        try:
+            return self.exponent_is_coefficient[exp]
+        except KeyError:
+            result = self.get_dependencies(exp) <= self.parameters
+            self.exponent_is_coefficient[exp] = result
+            return result
+
+    def split_term_key(self, mul_term):
+        """Returns a pair consisting of:
+        - a monomial key, i.e. a sorted tuple of (base id, exponent) pairs,
+          where the base ids are as returned by :meth:`get_base_id`
+        - a list of coefficients (i.e. constants and parameters)
+
+        The argument `mul_term' has to be fully expanded already.
         """
-        from pymbolic.primitives import Product, Power, AlgebraicLeaf
-
-        def base(term):
-            if isinstance(term, Power):
-                return term.base
-            else:
-                return term
-
-        def exponent(term):
-            if isinstance(term, Power):
-                return term.exponent
-            else:
-                return 1
-
         if isinstance(mul_term, Product):
             terms = mul_term.children
         elif isinstance(mul_term, (Power, AlgebraicLeaf)):
@@ -75,38 +94,94 @@ class TermCollector(IdentityMapper):
         else:
             raise RuntimeError("split_term expects a multiplicative term")
 
-        base2exp = {}
+        coefficients = []
+        id2exp = {}
         for term in terms:
-            mybase = base(term)
-            myexp = exponent(term)
+            if is_constant(term):
+                coefficients.append(term)
+                continue
 
-            if mybase in base2exp:
-                base2exp[mybase] += myexp
+            if isinstance(term, Power):
+                base_id = self.get_base_id(term.base)
+                exp = term.exponent
             else:
-                base2exp[mybase] = myexp
+                base_id = self.get_base_id(term)
+                exp = 1
 
-        coefficients = []
-        cleaned_base2exp = {}
-        for base, exp in six.iteritems(base2exp):
-            term = base**exp
-            if self.get_dependencies(term) <= self.parameters:
-                coefficients.append(term)
+            if base_id in id2exp:
+                id2exp[base_id] = id2exp[base_id] + exp
             else:
-                cleaned_base2exp[base] = exp
+                id2exp[base_id] = exp
+
+        key = []
+        for base_id, exp in six.iteritems(id2exp):
+            if is_constant(exp) and exp == 0:
+                continue
+
+            if (self.base_id_is_coefficient[base_id]
+                    and self.is_coefficient_exponent(exp)):
+                coefficients.append(self.id_to_base[base_id]**exp)
+            else:
+                key.append((base_id, exp))
+
+        # base ids are unique, so exponents are never compared
+        key.sort()
+        return tuple(key), coefficients
+
+    def split_term(self, mul_term):
+        """Returns  a pair consisting of:
+        - a frozenset of (base, exponent) pairs
+        - a product of coefficients (i.e. constants and parameters)
 
+        The set takes care of order-invariant comparison for us and is hashable.
+
+        The argument `product' has to be fully expanded already.
+        """
+        key, coefficients = self.split_term_key(mul_term)
         term = frozenset(
-                (base, exp) for base, exp in six.iteritems(cleaned_base2exp))
-        return term, self.rec(pymbolic.flattened_product(coefficients))
+                (self.id_to_base[base_id], exp) for base_id, exp in key)
+        return term, self.get_coefficient(coefficients)
+
+    def get_coefficient(self, coefficients):
+        constant = 1
+        nonconstants = []
+        for coeff in coefficients:
+            if is_constant(coeff):
+                constant = constant * coeff
+            else:
+                nonconstants.append(coeff)
 
-    def map_sum(self, mysum):
-        term2coeff = {}
-        for child in mysum.children:
-            term, coeff = self.split_term(child)
-            term2coeff[term] = term2coeff.get(term, 0) + coeff
+        if not nonconstants:
+            return constant
 
-        def rep2term(rep):
-            return pymbolic.flattened_product(base**exp for base, exp in rep)
+        return self.rec(pymbolic.flattened_product([constant] + nonconstants))
 
-        result = pymbolic.flattened_sum(coeff*rep2term(termrep)
-                for termrep, coeff in six.iteritems(term2coeff))
+    def map_sum(self, mysum):
+        key2coeffs = {}
+        for child in mysum.children:
+            key, coefficients = self.split_term_key(child)
+            coeff = self.get_coefficient(coefficients)
+
+            try:
+                key2coeffs[key].append(coeff)
+            except KeyError:
+                key2coeffs[key] = [coeff]
+
+        def key2term(key):
+            return pymbolic.flattened_product(
+                    self.id_to_base[base_id]**exp for base_id, exp in key)
+
+        def sum_coeffs(coeffs):
+            constant = 0
+            nonconstants = []
+            for coeff in coeffs:
+                if is_constant(coeff):
+                    constant = constant + coeff
+                else:
+                    nonconstants.append(coeff)
+
+            return pymbolic.flattened_sum([constant] + nonconstants)
+
+        result = pymbolic.flattened_sum(sum_coeffs(coeffs)*key2term(key)
+                for key, coeffs in six.iteritems(key2coeffs))
         return result
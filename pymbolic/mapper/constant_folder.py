@@ -23,43 +23,97 @@ THE SOFTWARE.
 """
 
 from six.moves import reduce
+import operator
 from pymbolic.mapper import \
         IdentityMapper, \
         CSECachingMapperMixin
+from pymbolic.primitives import is_constant as is_numeric
+
+
+# Functions from :mod:`math` that may be evaluated on constant arguments,
+# when called as ``math.<name>(...)``, as in :mod:`pymbolic.functions`.
+FOLDABLE_MATH_FUNCTIONS = frozenset("""
+        sin cos tan asin acos atan atan2 sinh cosh tanh asinh acosh atanh
+        exp expm1 log log10 log1p log2 sqrt fabs floor ceil copysign
+        """.split())
+
+_COMPARISON_OPERATORS = {
+        "==": operator.eq,
+        "!=": operator.ne,
+        "<": operator.lt,
+        "<=": operator.le,
+        ">": operator.gt,
+        ">=": operator.ge,
+        }
 
 
 class ConstantFoldingMapperBase(object):
+    """Folds constant subexpressions in a single bottom-up traversal.
+
+    Each mapper method receives the already-folded children of its node. A
+    child that is not a number (see :func:`pymbolic.primitives.is_constant`)
+    but for which :meth:`is_constant` holds is replaced by its value as
+    found by :meth:`evaluate`, if any. Operations that fail on their
+    constant operands (e.g. division by zero) are left unfolded.
+
+    .. automethod:: is_constant
+    .. automethod:: evaluate
+    """
+
     def is_constant(self, expr):
-        from pymbolic.mapper.dependency import DependencyMapper
-        return not bool(DependencyMapper()(expr))
+        """Return whether *expr* (already folded) has no dependencies."""
+        try:
+            dep_mapper = self._dependency_mapper
+        except AttributeError:
+            from pymbolic.mapper.dependency import CachedDependencyMapper
+            dep_mapper = self._dependency_mapper = CachedDependencyMapper()
+
+        return not bool(dep_mapper(expr))
 
     def evaluate(self, expr):
+        """Return the value of the constant *expr*, or *None* if it cannot be
+        evaluated.
+        """
         from pymbolic import evaluate
         try:
             return evaluate(expr)
         except ValueError:
             return None
 
-    def fold(self, expr, klass, op, constructor):
+    def _fold_child(self, expr):
+        result = self.rec(expr)  # pylint:disable=no-member
+
+        if not is_numeric(result) and self.is_constant(result):
+            value = self._apply(self.evaluate, result)
+            if value is not None:
+                return value
+
+        return result
+
+    def _apply(self, func, *args):
+        try:
+            return func(*args)
+        except (ArithmeticError, ValueError, TypeError):
+            return None
 
+    def fold(self, expr, klass, op, constructor):
         constants = []
         nonconstants = []
 
-        queue = list(expr.children)
-        while queue:
-            child = self.rec(queue.pop(0))  # pylint:disable=no-member
+        for child in expr.children:
+            child = self._fold_child(child)
+
             if isinstance(child, klass):
-                queue = list(child.children) + queue
+                # already folded, so its children need not be mapped again
+                grandchildren = child.children
             else:
-                if self.is_constant(child):
-                    value = self.evaluate(child)
-                    if value is None:
-                        # couldn't evaluate
-                        nonconstants.append(child)
-                    else:
-                        constants.append(value)
+                grandchildren = (child,)
+
+            for grandchild in grandchildren:
+                if is_numeric(grandchild):
+                    constants.append(grandchild)
                 else:
-                    nonconstants.append(child)
+                    nonconstants.append(grandchild)
 
         if constants:
             constant = reduce(op, constants)
@@ -69,16 +123,146 @@ class ConstantFoldingMapperBase(object):
 
     def map_sum(self, expr):
         from pymbolic.primitives import Sum, flattened_sum
-        import operator
-
         return self.fold(expr, Sum, operator.add, flattened_sum)
 
+    def map_product(self, expr):
+        from pymbolic.primitives import flattened_product
+        children = [self._fold_child(child) for child in expr.children]
+
+        if all(is_numeric(child) for child in children):
+            return reduce(operator.mul, children, 1)
+
+        return flattened_product(tuple(children))
+
+    def _map_binary(self, expr, op, left, right):
+        left = self._fold_child(left)
+        right = self._fold_child(right)
+
+        if is_numeric(left) and is_numeric(right):
+            result = self._apply(op, left, right)
+            if result is not None:
+                return result
+
+        return type(expr)(left, right)
+
+    def map_quotient(self, expr):
+        return self._map_binary(
+                expr, operator.truediv, expr.numerator, expr.denominator)
+
+    def map_floor_div(self, expr):
+        return self._map_binary(
+                expr, operator.floordiv, expr.numerator, expr.denominator)
+
+    def map_remainder(self, expr):
+        return self._map_binary(
+                expr, operator.mod, expr.numerator, expr.denominator)
+
+    def map_power(self, expr):
+        return self._map_binary(expr, operator.pow, expr.base, expr.exponent)
+
+    def map_call(self, expr):
+        from pymbolic.primitives import Lookup, Variable
+
+        function = self.rec(expr.function)  # pylint:disable=no-member
+        parameters = tuple(
+                self._fold_child(par) for par in expr.parameters)
+
+        if (isinstance(function, Lookup)
+                and function.aggregate == Variable("math")
+                and function.name in FOLDABLE_MATH_FUNCTIONS
+                and all(is_numeric(par) for par in parameters)):
+            import math
+            result = self._apply(getattr(math, function.name), *parameters)
+            if result is not None:
+                return result
+
+        return type(expr)(function, parameters)
+
+    def map_comparison(self, expr):
+        left = self._fold_child(expr.left)
+        right = self._fold_child(expr.right)
+
+        if is_numeric(left) and is_numeric(right):
+            result = self._apply(
+                    _COMPARISON_OPERATORS[expr.operator], left, right)
+            if result is not None:
+                return result
+
+        return type(expr)(left, expr.operator, right)
+
+    def map_logical_not(self, expr):
+        child = self._fold_child(expr.child)
+        if is_numeric(child):
+            return not child
+
+        return type(expr)(child)
+
+    def _map_logical_junction(self, expr, absorbing):
+        children = []
+        for child in expr.children:
+            child = self._fold_child(child)
+            if is_numeric(child):
+                if bool(child) == absorbing:
+                    return absorbing
+                # neutral element: drop
+            else:
+                children.append(child)
+
+        if not children:
+            return not absorbing
+        elif len(children) == 1:
+            return children[0]
+        else:
+            return type(expr)(tuple(children))
+
+    def map_logical_and(self, expr):
+        return self._map_logical_junction(expr, absorbing=False)
+
+    def map_logical_or(self, expr):
+        return self._map_logical_junction(expr, absorbing=True)
+
+    def map_if(self, expr):
+        condition = self._fold_child(expr.condition)
+        if is_numeric(condition):
+            if condition:
+                return self.rec(expr.then)  # pylint:disable=no-member
+            else:
+                return self.rec(expr.else_)  # pylint:disable=no-member
+
+        return type(expr)(
+                condition,
+                self.rec(expr.then),  # pylint:disable=no-member
+                self.rec(expr.else_))  # pylint:disable=no-member
+
+    def map_if_positive(self, expr):
+        criterion = self._fold_child(expr.criterion)
+        if is_numeric(criterion) and not isinstance(criterion, complex):
+            if criterion > 0:
+                return self.rec(expr.then)  # pylint:disable=no-member
+            else:
+                return self.rec(expr.else_)  # pylint:disable=no-member
+
+        return type(expr)(
+                criterion,
+                self.rec(expr.then),  # pylint:disable=no-member
+                self.rec(expr.else_))  # pylint:disable=no-member
+
+    def map_common_subexpression_uncached(self, expr):
+        child = self._fold_child(expr.child)
+        if is_numeric(child):
+            # no point in naming a constant
+            return child
+
+        return type(expr)(
+                child,
+                expr.prefix,
+                expr.scope,
+                **expr.get_extra_properties())
+
 
 class CommutativeConstantFoldingMapperBase(ConstantFoldingMapperBase):
     def map_product(self, expr):
         from pymbolic.primitives import Product, flattened_product
-        import operator
-
         return self.fold(expr, Product, operator.mul, flattened_product)
 
 
@@ -86,15 +270,11 @@ class ConstantFoldingMapper(
         CSECachingMapperMixin,
         ConstantFoldingMapperBase,
         IdentityMapper):
-
-    map_common_subexpression_uncached = \
-            IdentityMapper.map_common_subexpression
+    pass
 
 
 class CommutativeConstantFoldingMapper(
         CSECachingMapperMixin,
         CommutativeConstantFoldingMapperBase,
         IdentityMapper):
-
-    map_common_subexpression_uncached = \
-            IdentityMapper.map_common_subexpression
+    pass
@@ -22,7 +22,7 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-from pymbolic.mapper import Collector, CSECachingMapperMixin
+from pymbolic.mapper import Collector, CSECachingMapperMixin, WalkMapper
 
 
 class DependencyMapper(CSECachingMapperMixin, Collector):
@@ -106,3 +106,166 @@ class DependencyMapper(CSECachingMapperMixin, Collector):
         return self.combine(
                 [self.rec(child) for child in expr.children
                     if child is not None])
+
+
+class AccumulatingDependencyMapper(WalkMapper):
+    """Finds the same dependencies as :class:`DependencyMapper` given the same
+    constructor arguments, but adds them to a single :class:`set` during one
+    traversal, rather than creating a set per node and merging them at each
+    level. Nodes occurring repeatedly in an expression (by identity, e.g. in
+    an expression DAG) are only traversed once, whether or not they are
+    wrapped in a :class:`pymbolic.primitives.CommonSubexpression`.
+
+    :arg cache_results: If *True*, remember the result for each expression
+        (by identity) passed to :meth:`__call__`, and return a copy of it
+        when the same expression is passed again.
+
+    .. automethod:: __call__
+    """
+
+    def __init__(self,
+            include_subscripts=True,
+            include_lookups=True,
+            include_calls=True,
+            include_cses=False,
+            composite_leaves=None,
+            cache_results=False):
+        if composite_leaves is False:
+            include_subscripts = False
+            include_lookups = False
+            include_calls = False
+        if composite_leaves is True:
+            include_subscripts = True
+            include_lookups = True
+            include_calls = True
+
+        assert include_calls in [True, False, "descend_args"]
+
+        self.include_subscripts = include_subscripts
+        self.include_lookups = include_lookups
+        self.include_calls = include_calls
+
+        self.include_cses = include_cses
+
+        if cache_results:
+            # maps id(expr) -> (expr, result), retaining expr so that its id
+            # stays valid
+            self.result_cache = {}
+        else:
+            self.result_cache = None
+
+    def __call__(self, expr):
+        """Return a :class:`set` of the dependencies of *expr*."""
+        if self.result_cache is not None:
+            try:
+                return set(self.result_cache[id(expr)][1])
+            except KeyError:
+                pass
+
+        self.dependencies = set()
+        self.visited_ids = set()
+        self.rec(expr)
+
+        result = self.dependencies
+        del self.dependencies
+        del self.visited_ids
+
+        if self.result_cache is not None:
+            self.result_cache[id(expr)] = (expr, frozenset(result))
+
+        return result
+
+    def visit(self, expr):
+        expr_id = id(expr)
+        if expr_id in self.visited_ids:
+            return False
+
+        self.visited_ids.add(expr_id)
+        return True
+
+    def map_variable(self, expr):
+        self.dependencies.add(expr)
+
+    def map_call(self, expr):
+        if self.include_calls == "descend_args":
+            if not self.visit(expr):
+                return
+
+            for child in expr.parameters:
+                self.rec(child)
+        elif self.include_calls:
+            self.dependencies.add(expr)
+        else:
+            super(AccumulatingDependencyMapper, self).map_call(expr)
+
+    def map_call_with_kwargs(self, expr):
+        if self.include_calls == "descend_args":
+            if not self.visit(expr):
+                return
+
+            for child in expr.parameters:
+                self.rec(child)
+            for child in expr.kw_parameters.values():
+                self.rec(child)
+        elif self.include_calls:
+            self.dependencies.add(expr)
+        else:
+            super(AccumulatingDependencyMapper, self).map_call_with_kwargs(expr)
+
+    def map_lookup(self, expr):
+        if self.include_lookups:
+            self.dependencies.add(expr)
+        else:
+            super(AccumulatingDependencyMapper, self).map_lookup(expr)
+
+    def map_subscript(self, expr):
+        if self.include_subscripts:
+            self.dependencies.add(expr)
+        else:
+            super(AccumulatingDependencyMapper, self).map_subscript(expr)
+
+    def map_common_subexpression(self, expr):
+        if self.include_cses:
+            self.dependencies.add(expr)
+        else:
+            super(AccumulatingDependencyMapper, self).map_common_subexpression(
+                    expr)
+
+
+class CachedDependencyMapper(DependencyMapper):
+    """A :class:`DependencyMapper` that remembers its result for each
+    :class:`pymbolic.primitives.Expression` it visits, and computes results
+    from those remembered for the children. Once an expression has been
+    mapped, finding the dependencies of it or any of its subexpressions
+    again with the same instance takes constant time.
+
+    Results are cached by node identity for the lifetime of the instance,
+    and are :class:`frozenset` instances, as they are shared among all
+    queries.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CachedDependencyMapper, self).__init__(*args, **kwargs)
+
+        # maps id(expr) -> (expr, result). *expr* is retained so that its id
+        # cannot be reused while the cache is alive.
+        self.result_cache = {}
+
+    def rec(self, expr):
+        try:
+            return self.result_cache[id(expr)][1]
+        except KeyError:
+            pass
+
+        result = frozenset(super(CachedDependencyMapper, self).rec(expr))
+
+        from pymbolic.primitives import Expression
+        if isinstance(expr, Expression):
+            self.result_cache[id(expr)] = (expr, result)
+
+        return result
+
+    __call__ = rec
+
+    def combine(self, values):
+        return frozenset().union(*values)
@@ -112,7 +112,17 @@ class DistributeMapper(IdentityMapper):
                 child**expr.exponent for child in newbase))
 
         if isinstance(expr.exponent, int):
-            if isinstance(newbase, Sum):
+            if (isinstance(newbase, Sum) and expr.exponent >= 0
+                    and isinstance(self.collector, TermCollector)):
+                # Multiplication is commutative, so multiply out by binary
+                # exponentiation of a sparse polynomial, rather than by
+                # repeatedly distributing over expression trees.
+                from pymbolic.mapper.expander import ExpandMapper
+                expander = ExpandMapper(self.collector.parameters)
+                return expander.from_polynomial(
+                        expander.to_polynomial(newbase) ** expr.exponent)
+
+            elif isinstance(newbase, Sum):
                 return self.map_product(
                         pymbolic.flattened_product(
                             expr.exponent*(newbase,)))
@@ -138,18 +138,13 @@ class EvaluationMapper(RecursiveMapper, CSECachingMapperMixin):
 
     def map_polynomial(self, expr):
         # evaluate using Horner's scheme
-        result = 0
-        rev_data = expr.data[::-1]
+        from pymbolic.polynomial import _horner, _horner_dense
         ev_base = self.rec(expr.base)
 
-        for i, (exp, coeff) in enumerate(rev_data):
-            if i+1 < len(rev_data):
-                next_exp = rev_data[i+1][0]
-            else:
-                next_exp = 0
-            result = (result+coeff)*ev_base**(exp-next_exp)
+        if getattr(expr, "DenseData", None) is not None:
+            return _horner_dense(expr.DenseData, ev_base)
 
-        return result
+        return _horner(expr.data, ev_base, self.rec)
 
     def map_list(self, expr):
         return [self.rec(child) for child in expr]
@@ -0,0 +1,340 @@
+"""Polynomial expansion"""
+
+__copyright__ = "Copyright (C) 2020 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+from operator import add
+
+from pymbolic.mapper import IdentityMapper
+from pymbolic.primitives import (
+        Sum, Product, Power, Quotient,
+        is_constant as is_numeric)
+
+
+# {{{ sparse polynomials
+
+def _multiply_monomials(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    # map() stops at the end of the shorter tuple
+    return tuple(map(add, a, b)) + a[len(b):]
+
+
+class SparsePolynomial(object):
+    """A multivariate polynomial with commutative coefficients, supporting
+    addition, subtraction, multiplication and powers with non-negative
+    integer exponents.
+
+    .. attribute:: data
+
+        A :class:`dict` mapping monomials to their (nonzero) coefficients. A
+        monomial is a :class:`tuple` of the exponents of the variables,
+        indexed by number. To keep monomials unique, trailing zero exponents
+        are omitted, so that ``()`` is the constant monomial.
+    """
+
+    def __init__(self, data=None):
+        if data is None:
+            data = {}
+        self.data = data
+
+    @classmethod
+    def constant(cls, value):
+        if value == 0:
+            return cls()
+        return cls({(): value})
+
+    @classmethod
+    def variable(cls, index):
+        return cls({(0,)*index + (1,): 1})
+
+    def __bool__(self):
+        return bool(self.data)
+
+    __nonzero__ = __bool__
+
+    def __eq__(self, other):
+        if not isinstance(other, SparsePolynomial):
+            other = SparsePolynomial.constant(other)
+        return self.data == other.data
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "SparsePolynomial(%r)" % self.data
+
+    def __neg__(self):
+        return SparsePolynomial(dict(
+            (monomial, -coeff) for monomial, coeff in self.data.items()))
+
+    def __add__(self, other):
+        if not isinstance(other, SparsePolynomial):
+            other = SparsePolynomial.constant(other)
+
+        result = dict(self.data)
+        for monomial, coeff in other.data.items():
+            coeff = result.get(monomial, 0) + coeff
+            if coeff == 0:
+                result.pop(monomial, None)
+            else:
+                result[monomial] = coeff
+
+        return SparsePolynomial(result)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self + (-other)
+
+    def __rsub__(self, other):
+        return (-self) + other
+
+    def __mul__(self, other):
+        if not isinstance(other, SparsePolynomial):
+            if other == 0:
+                return SparsePolynomial()
+            return SparsePolynomial(dict(
+                (monomial, coeff*other)
+                for monomial, coeff in self.data.items()))
+
+        result = {}
+        get = result.get
+        other_items = list(other.data.items())
+        for monomial, coeff in self.data.items():
+            for other_monomial, other_coeff in other_items:
+                product_monomial = _multiply_monomials(monomial, other_monomial)
+                result[product_monomial] = (
+                        get(product_monomial, 0) + coeff*other_coeff)
+
+        return SparsePolynomial(dict(
+            (monomial, coeff)
+            for monomial, coeff in result.items()
+            if coeff != 0))
+
+    __rmul__ = __mul__
+
+    def __pow__(self, n):
+        if not isinstance(n, int) or n < 0:
+            raise ValueError("only non-negative integer powers of "
+                    "polynomials are supported")
+
+        from pymbolic.algorithm import integer_power
+        return integer_power(self, n, one=SparsePolynomial.constant(1))
+
+# }}}
+
+
+# {{{ expand mapper
+
+class ExpandMapper(IdentityMapper):
+    """Multiplies out all products and non-negative integer powers of sums
+    and collects terms, assuming that multiplication is commutative. This
+    computes the same result as
+    :class:`~pymbolic.mapper.distributor.DistributeMapper` with a
+    :class:`~pymbolic.mapper.collector.TermCollector`, but does the
+    arithmetic on :class:`SparsePolynomial` instances, whose variables are
+    the subexpressions that are not sums, products or powers (after
+    expansion of their own subexpressions).
+
+    :arg parameters: a set of :class:`~pymbolic.primitives.Variable`
+        instances that are viewed as being coefficients and are not used for
+        term collection, see
+        :class:`~pymbolic.mapper.collector.TermCollector`.
+
+    .. attribute:: atoms
+
+        A list of the subexpressions serving as the variables of the
+        polynomials, by index.
+
+    .. automethod:: to_polynomial
+    .. automethod:: from_polynomial
+    """
+
+    def __init__(self, parameters=frozenset()):
+        self.parameters = frozenset(parameters)
+
+        self.atoms = []
+        self.atom_to_index = {}
+
+        # maps id(expr) -> (expr, polynomial), keeping expr alive
+        self.polynomial_cache = {}
+
+    def get_atom_index(self, atom):
+        try:
+            return self.atom_to_index[atom]
+        except KeyError:
+            index = len(self.atoms)
+            self.atoms.append(atom)
+            self.atom_to_index[atom] = index
+            return index
+
+    def to_polynomial(self, expr):
+        """Return a :class:`SparsePolynomial` equal to *expr*, with variables
+        numbered as in :attr:`atoms`.
+        """
+        if is_numeric(expr):
+            return SparsePolynomial.constant(expr)
+
+        try:
+            return self.polynomial_cache[id(expr)][1]
+        except KeyError:
+            pass
+
+        if isinstance(expr, Sum):
+            data = {}
+            get = data.get
+            for child in expr.children:
+                for monomial, coeff in self.to_polynomial(child).data.items():
+                    data[monomial] = get(monomial, 0) + coeff
+
+            result = SparsePolynomial(dict(
+                (monomial, coeff)
+                for monomial, coeff in data.items()
+                if coeff != 0))
+
+        elif isinstance(expr, Product):
+            result = SparsePolynomial.constant(1)
+            for child in expr.children:
+                result = result * self.to_polynomial(child)
+
+        elif (isinstance(expr, Power)
+                and isinstance(expr.exponent, int) and expr.exponent >= 0):
+            result = self.to_polynomial(expr.base) ** expr.exponent
+
+        elif isinstance(expr, Quotient) and not (
+                is_numeric(expr.numerator) and expr.numerator == 1):
+            # as in DistributeMapper.map_quotient
+            result = self.to_polynomial(expr.numerator) * self.to_polynomial(
+                    type(expr)(1, expr.denominator))
+
+        else:
+            # map_* below do not call back into to_polynomial for any of the
+            # node types ending up here
+            result = SparsePolynomial.variable(self.get_atom_index(
+                    self.rec(expr)))
+
+        self.polynomial_cache[id(expr)] = (expr, result)
+        return result
+
+    def from_polynomial(self, poly):
+        """Return an expression equal to the :class:`SparsePolynomial`
+        *poly*, with variables numbered as in :attr:`atoms`. Terms are sorted
+        lexicographically by their monomials, in descending order.
+        """
+        def make_monomial(monomial):
+            return [
+                    atom if exp == 1 else Power(atom, exp)
+                    for atom, exp in zip(self.atoms, monomial)
+                    if exp]
+
+        def make_term(coeff, factors):
+            if not factors:
+                return coeff
+
+            if is_numeric(coeff) and coeff == 1:
+                if len(factors) == 1:
+                    return factors[0]
+                return Product(tuple(factors))
+            elif isinstance(coeff, Product):
+                return Product(coeff.children + tuple(factors))
+            else:
+                return Product((coeff,) + tuple(factors))
+
+        monomials = sorted(poly.data, reverse=True)
+
+        if not self.parameters:
+            terms = [
+                    make_term(poly.data[monomial], make_monomial(monomial))
+                    for monomial in monomials]
+        else:
+            # group terms by their non-parameter factors
+            from pymbolic.mapper.dependency import CachedDependencyMapper
+            dep_mapper = CachedDependencyMapper()
+            is_parameter = [
+                    dep_mapper(atom) <= self.parameters for atom in self.atoms]
+
+            rest_to_coeff_terms = {}
+            natoms = len(self.atoms)
+            for monomial in monomials:
+                coeff = poly.data[monomial]
+                monomial = monomial + (0,)*(natoms - len(monomial))
+                param_monomial = tuple(
+                        exp if is_param else 0
+                        for exp, is_param in zip(monomial, is_parameter))
+                rest_monomial = tuple(
+                        0 if is_param else exp
+                        for exp, is_param in zip(monomial, is_parameter))
+
+                rest_to_coeff_terms.setdefault(rest_monomial, []).append(
+                        make_term(coeff, make_monomial(param_monomial)))
+
+            terms = []
+            for rest_monomial, coeff_terms in rest_to_coeff_terms.items():
+                if len(coeff_terms) == 1:
+                    coeff, = coeff_terms
+                else:
+                    coeff = Sum(tuple(coeff_terms))
+                terms.append(make_term(coeff, make_monomial(rest_monomial)))
+
+        if not terms:
+            return 0
+        elif len(terms) == 1:
+            return terms[0]
+        else:
+            return Sum(tuple(terms))
+
+    def map_sum(self, expr):
+        return self.from_polynomial(self.to_polynomial(expr))
+
+    map_product = map_sum
+
+    def map_power(self, expr):
+        if isinstance(expr.exponent, int) and expr.exponent >= 0:
+            return self.from_polynomial(self.to_polynomial(expr))
+        else:
+            return IdentityMapper.map_power(self, expr)
+
+    def map_quotient(self, expr):
+        if is_numeric(expr.numerator) and expr.numerator == 1:
+            return IdentityMapper.map_quotient(self, expr)
+        else:
+            return self.from_polynomial(self.to_polynomial(expr))
+
+
+def expand(expr, parameters=frozenset(), commutative=True):
+    """Multiply out products and powers of sums in *expr* and collect terms.
+    For non-commutative multiplication, this falls back to
+    :func:`pymbolic.mapper.distributor.distribute`.
+
+    See :class:`ExpandMapper` for the meaning of *parameters*.
+    """
+    if not commutative:
+        from pymbolic.mapper.distributor import distribute
+        return distribute(expr, parameters, commutative=False)
+
+    return ExpandMapper(parameters)(expr)
+
+# }}}
+
+# vim: foldmethod=marker
@@ -0,0 +1,355 @@
+"""Algebraic simplification"""
+
+__copyright__ = "Copyright (C) 2020 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from pymbolic.mapper import IdentityMapper, CombineMapper
+from pymbolic.mapper.constant_folder import (
+        CommutativeConstantFoldingMapperBase,
+        ConstantFoldingMapperBase)
+from pymbolic.primitives import (
+        Sum, Product, Power,
+        is_constant as is_numeric)
+
+
+# {{{ simplify mapper
+
+class SimplifyMapper(CommutativeConstantFoldingMapperBase, IdentityMapper):
+    """Rewrites an expression into a canonical, simplified form in a single
+    bottom-up pass, assuming that multiplication is commutative. This fuses
+    the work of :class:`~pymbolic.mapper.flattener.FlattenMapper`,
+    :class:`~pymbolic.mapper.constant_folder.CommutativeConstantFoldingMapper`
+    and :class:`~pymbolic.mapper.collector.TermCollector` (and, optionally,
+    :class:`~pymbolic.mapper.distributor.DistributeMapper`):
+
+    * nested sums and products are flattened,
+    * constants are folded,
+    * equal factors of a product are merged into powers,
+    * terms of a sum differing only in their constant coefficient are
+      collected.
+
+    Each (identical) subexpression is only mapped once.
+
+    :arg distribute: If *True*, products of sums and powers of sums with
+        small, positive integer exponents are multiplied out.
+    """
+
+    def __init__(self, distribute=False, max_distribute_exponent=8):
+        self.distribute = distribute
+        self.max_distribute_exponent = max_distribute_exponent
+
+        # maps id(expr) -> (expr, result), keeping expr alive
+        self.result_cache = {}
+
+        # Results are generally in canonical form after one pass. This is
+        # set if a rewrite was made whose outcome may be simplified further
+        # by another pass.
+        self.may_simplify_further = False
+
+    def rec(self, expr):
+        try:
+            return self.result_cache[id(expr)][1]
+        except KeyError:
+            result = super(SimplifyMapper, self).rec(expr)
+            self.result_cache[id(expr)] = (expr, result)
+            return result
+
+    __call__ = rec
+
+    # node-level caching already covers common subexpressions
+    map_common_subexpression = \
+            ConstantFoldingMapperBase.map_common_subexpression_uncached
+
+    # {{{ canonical sums
+
+    def _split_coefficient(self, term):
+        if isinstance(term, Product) and is_numeric(term.children[0]):
+            return term.children[0], term.children[1:]
+        elif isinstance(term, Product):
+            return 1, term.children
+        else:
+            return 1, (term,)
+
+    def make_sum(self, terms):
+        """Return the canonical form of the sum of *terms*, each of which is
+        expected to be in canonical form.
+        """
+        constant = 0
+        # maps the multiset of non-constant factors (as a frozenset of
+        # (factor, count) pairs) to a list [coeff, factors]
+        key_to_term = {}
+
+        for term in terms:
+            if isinstance(term, Sum):
+                subterms = term.children
+            else:
+                subterms = (term,)
+
+            for subterm in subterms:
+                if is_numeric(subterm):
+                    constant = constant + subterm
+                    continue
+
+                coeff, factors = self._split_coefficient(subterm)
+
+                # factors may repeat, e.g. after splatting products in
+                # make_product
+                factor_counts = {}
+                for factor in factors:
+                    factor_counts[factor] = factor_counts.get(factor, 0) + 1
+                key = frozenset(factor_counts.items())
+                try:
+                    entry = key_to_term[key]
+                except KeyError:
+                    key_to_term[key] = [coeff, factors]
+                else:
+                    entry[0] = entry[0] + coeff
+
+        result = []
+        if constant != 0:
+            result.append(constant)
+
+        for coeff, factors in key_to_term.values():
+            if coeff == 0:
+                continue
+            elif coeff == 1:
+                if len(factors) == 1:
+                    result.append(factors[0])
+                else:
+                    result.append(Product(factors))
+            else:
+                result.append(Product((coeff,) + factors))
+
+        if not result:
+            return 0
+        elif len(result) == 1:
+            return result[0]
+        else:
+            return Sum(tuple(result))
+
+    def map_sum(self, expr):
+        return self.make_sum([self.rec(child) for child in expr.children])
+
+    # }}}
+
+    # {{{ canonical products
+
+    def make_product(self, factors):
+        """Return the canonical form of the product of *factors*, each of
+        which is expected to be in canonical form.
+        """
+        coeff = 1
+        # maps bases to exponents
+        base_to_exp = {}
+
+        for factor in factors:
+            if isinstance(factor, Product):
+                subfactors = factor.children
+            else:
+                subfactors = (factor,)
+
+            for subfactor in subfactors:
+                if is_numeric(subfactor):
+                    coeff = coeff * subfactor
+                    continue
+
+                if isinstance(subfactor, Power):
+                    base, exp = subfactor.base, subfactor.exponent
+                else:
+                    base, exp = subfactor, 1
+
+                if base in base_to_exp:
+                    prev_exp = base_to_exp[base]
+                    if is_numeric(prev_exp) and is_numeric(exp):
+                        base_to_exp[base] = prev_exp + exp
+                    else:
+                        base_to_exp[base] = self.make_sum([prev_exp, exp])
+                else:
+                    base_to_exp[base] = exp
+
+        if coeff == 0:
+            return 0
+
+        result = []
+        sums = []
+        for base, exp in base_to_exp.items():
+            factor = self.make_power(base, exp)
+            if is_numeric(factor):
+                coeff = coeff * factor
+            elif self.distribute and isinstance(factor, Sum):
+                sums.append(factor)
+            elif isinstance(factor, Product):
+                # e.g. from (2*x)**0.5 * (2*x)**0.5, merging of its factors
+                # with the remaining ones is left to the next pass
+                self.may_simplify_further = True
+                for subfactor in factor.children:
+                    if is_numeric(subfactor):
+                        coeff = coeff * subfactor
+                    else:
+                        result.append(subfactor)
+            else:
+                result.append(factor)
+
+        if coeff != 1:
+            result.insert(0, coeff)
+
+        if not result:
+            result = 1
+        elif len(result) == 1:
+            result = result[0]
+        else:
+            result = Product(tuple(result))
+
+        for sum_factor in sums:
+            result = self._multiply_out(result, sum_factor)
+
+        return result
+
+    def _multiply_out(self, a, b):
+        a_terms = a.children if isinstance(a, Sum) else (a,)
+        b_terms = b.children if isinstance(b, Sum) else (b,)
+
+        return self.make_sum([
+                self.make_product([a_term, b_term])
+                for a_term in a_terms
+                for b_term in b_terms])
+
+    def map_product(self, expr):
+        return self.make_product(
+                [self.rec(child) for child in expr.children])
+
+    # }}}
+
+    # {{{ canonical powers
+
+    def make_power(self, base, exp):
+        """Return the canonical form of *base* raised to *exp*, both of which
+        are expected to be in canonical form.
+        """
+        if is_numeric(exp):
+            if exp == 0:
+                return 1
+            if exp == 1:
+                return base
+
+            if is_numeric(base):
+                result = self._apply(pow, base, exp)
+                if result is not None:
+                    return result
+
+            elif isinstance(exp, int):
+                if isinstance(base, Power) and isinstance(base.exponent, int):
+                    return self.make_power(base.base, base.exponent*exp)
+
+                if isinstance(base, Product):
+                    return self.make_product([
+                            self.make_power(factor, exp)
+                            for factor in base.children])
+
+                if (self.distribute and isinstance(base, Sum)
+                        and 0 < exp <= self.max_distribute_exponent):
+                    result = base
+                    for _ in range(exp-1):
+                        result = self._multiply_out(result, base)
+                    return result
+
+        elif is_numeric(base) and base == 1:
+            return 1
+
+        return Power(base, exp)
+
+    def map_power(self, expr):
+        return self.make_power(self.rec(expr.base), self.rec(expr.exponent))
+
+    def map_quotient(self, expr):
+        result = super(SimplifyMapper, self).map_quotient(expr)
+        if (isinstance(result, type(expr))
+                and is_numeric(result.denominator)
+                and result.denominator == 1):
+            return result.numerator
+
+        return result
+
+    # }}}
+
+# }}}
+
+
+# {{{ cost
+
+class _NodeCounter(CombineMapper):
+    def combine(self, values):
+        return 1 + sum(values)
+
+    def map_constant(self, expr):
+        return 1
+
+    map_variable = map_constant
+    map_function_symbol = map_constant
+
+
+def _get_cost(expr):
+    from pymbolic.mapper.flop_counter import FlopCounter
+    return FlopCounter()(expr), _NodeCounter()(expr)
+
+# }}}
+
+
+# {{{ driver
+
+def simplify(expr, distribute=False, max_iterations=10, max_growth=1):
+    """Simplify *expr* by applying :class:`SimplifyMapper` until the result is
+    in canonical form, or at most *max_iterations* times.
+
+    Each intermediate result must stay within a budget: Its flop count (as
+    determined by :class:`~pymbolic.mapper.flop_counter.FlopCounter`) and its
+    number of nodes may exceed those of *expr* by at most a factor of
+    *max_growth*. Iteration stops at the first result exceeding the budget,
+    and the last result within the budget is returned. Pass *None* for
+    *max_growth* to disable the budget, e.g. when using *distribute*.
+
+    :arg distribute: see :class:`SimplifyMapper`.
+    """
+    if max_growth is not None:
+        flops, nodes = _get_cost(expr)
+        max_flops = max_growth * max(flops, 1)
+        max_nodes = max_growth * max(nodes, 1)
+
+    for _ in range(max_iterations):
+        mapper = SimplifyMapper(distribute=distribute)
+        new_expr = mapper(expr)
+
+        if max_growth is not None:
+            flops, nodes = _get_cost(new_expr)
+            if flops > max_flops or nodes > max_nodes:
+                break
+
+        expr = new_expr
+
+        if not mapper.may_simplify_further:
+            break
+
+    return expr
+
+# }}}
+
+# vim: foldmethod=marker
@@ -30,28 +30,746 @@ from pymbolic.primitives import Expression
 import pymbolic.algorithm as algorithm
 from pymbolic.traits import traits, EuclideanRingTraits, FieldTraits
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 
-def _sort_uniq(data):
-    def sortkey(xxx_todo_changeme): (exp, coeff) = xxx_todo_changeme; return exp
-    data.sort(key=sortkey)
 
-    uniq_result = []
-    i = 0
-    last_exp = None
+# {{{ multiplication
+
+# Below these lengths, the schoolbook algorithm wins.
+KARATSUBA_THRESHOLD = 24
+KRONECKER_THRESHOLD = 8
+
+
+def _is_int(x):
+    return isinstance(x, int) and not isinstance(x, bool)
+
+
+def _is_number(x):
+    from pymbolic.primitives import is_constant
+    return is_constant(x)
+
+
+def _to_dense(data):
+    """Return *(low_exp, coeffs)*, where *coeffs* lists the coefficients of
+    *data* for exponents *low_exp*, *low_exp+1*, ..., with gaps filled by
+    zeros.
+    """
+    low_exp = data[0][0]
+    result = [0]*(data[-1][0] - low_exp + 1)
     for exp, coeff in data:
-        if last_exp == exp:
-            newcoeff = uniq_result[-1][1]+coeff
-            if not newcoeff:
-                uniq_result.pop()
+        result[exp - low_exp] = coeff
+    return low_exp, result
+
+
+def _from_dense(low_exp, coeffs):
+    # zero coefficients, including zero polynomials, are dropped
+    return tuple(
+            (low_exp+i, coeff)
+            for i, coeff in enumerate(coeffs)
+            if coeff)
+
+
+def _is_dense(data):
+    return 2*len(data) >= data[-1][0] - data[0][0] + 1
+
+
+def _multiply_schoolbook(a_data, b_data):
+    exp_to_coeff = {}
+    for a_exp, a_coeff in a_data:
+        for b_exp, b_coeff in b_data:
+            exp = a_exp + b_exp
+            if exp in exp_to_coeff:
+                exp_to_coeff[exp] = exp_to_coeff[exp] + a_coeff*b_coeff
+            else:
+                exp_to_coeff[exp] = a_coeff*b_coeff
+
+    return tuple(
+            (exp, exp_to_coeff[exp])
+            for exp in sorted(exp_to_coeff)
+            if exp_to_coeff[exp])
+
+
+def _multiply_dense_schoolbook(a, b):
+    result = [0]*(len(a)+len(b)-1)
+    for i, a_coeff in enumerate(a):
+        for j, b_coeff in enumerate(b):
+            result[i+j] = result[i+j] + a_coeff*b_coeff
+    return result
+
+
+def _add_dense(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    return [a_coeff + b_coeff for a_coeff, b_coeff in zip(a, b)] + a[len(b):]
+
+
+def _multiply_karatsuba(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    n = len(a)
+    m = len(b)
+
+    if m < KARATSUBA_THRESHOLD:
+        return _multiply_dense_schoolbook(a, b)
+
+    result = [0]*(n+m-1)
+
+    if 2*m <= n:
+        # unbalanced: multiply b by chunks of a of the same length
+        for start in range(0, n, m):
+            for i, coeff in enumerate(_multiply_karatsuba(a[start:start+m], b)):
+                result[start+i] = result[start+i] + coeff
+        return result
+
+    h = n // 2
+    a_low, a_high = a[:h], a[h:]
+    b_low, b_high = b[:h], b[h:]
+
+    low = _multiply_karatsuba(a_low, b_low)
+    high = _multiply_karatsuba(a_high, b_high)
+    mid = _multiply_karatsuba(_add_dense(a_low, a_high), _add_dense(b_low, b_high))
+
+    for i, coeff in enumerate(low):
+        result[i] = result[i] + coeff
+        mid[i] = mid[i] - coeff
+    for i, coeff in enumerate(high):
+        result[2*h+i] = result[2*h+i] + coeff
+        mid[i] = mid[i] - coeff
+    for i, coeff in enumerate(mid):
+        result[h+i] = result[h+i] + coeff
+
+    return result
+
+
+def _multiply_kronecker(a, b):
+    """Multiply integer coefficient lists by Kronecker substitution, i.e. by
+    evaluating both at a power of two, multiplying the resulting (big)
+    integers and reading off the coefficients of the product from the digits
+    of the result.
+    """
+    max_coeff = (
+            max(abs(coeff) for coeff in a)
+            * max(abs(coeff) for coeff in b)
+            * min(len(a), len(b)))
+    # one more bit for the sign, rounded up to whole bytes
+    nbytes = (max_coeff.bit_length() + 1 + 7) // 8
+    nbits = 8*nbytes
+
+    def pack(coeffs):
+        pos = b"".join(max(coeff, 0).to_bytes(nbytes, "little") for coeff in coeffs)
+        neg = b"".join(max(-coeff, 0).to_bytes(nbytes, "little") for coeff in coeffs)
+        return int.from_bytes(pos, "little") - int.from_bytes(neg, "little")
+
+    nresult = len(a)+len(b)-1
+    # Bias each digit by 2**(nbits-1) to make it non-negative.
+    half = 1 << (nbits-1)
+    bias = int.from_bytes(half.to_bytes(nbytes, "little")*nresult, "little")
+
+    product = (pack(a)*pack(b) + bias).to_bytes(nbytes*nresult, "little")
+    return [
+            int.from_bytes(product[i*nbytes:(i+1)*nbytes], "little") - half
+            for i in range(nresult)]
+
+
+def _multiply_numpy(a, b):
+    a = numpy.asarray(a)
+    b = numpy.asarray(b)
+
+    if not len(a) or not len(b):
+        return numpy.zeros(0, numpy.result_type(a, b))
+
+    # Direct convolution rather than FFTs: FFT round-off is relative to the
+    # largest coefficient, which wipes out small ones.
+    return numpy.convolve(a, b)
+
+
+def _multiply_data(a_data, b_data):
+    """Multiply the polynomials given by the (sorted) data tuples *a_data*
+    and *b_data*, picking an algorithm suited to their coefficients.
+    """
+    if not a_data or not b_data:
+        return ()
+
+    size = min(len(a_data), len(b_data))
+    if size < KRONECKER_THRESHOLD or not (_is_dense(a_data) and _is_dense(b_data)):
+        return _multiply_schoolbook(a_data, b_data)
+
+    a_low, a = _to_dense(a_data)
+    b_low, b = _to_dense(b_data)
+
+    if all(_is_int(coeff) for coeff in a) and all(_is_int(coeff) for coeff in b):
+        return _from_dense(a_low+b_low, _multiply_kronecker(a, b))
+
+    if all(_is_number(coeff) for coeff in a) and all(_is_number(coeff) for coeff in b):
+        return _from_dense(a_low+b_low, _multiply_numpy(a, b).tolist())
+
+    if size >= KARATSUBA_THRESHOLD and not any(
+            isinstance(coeff, Expression) and not isinstance(coeff, Polynomial)
+            for coeff in a + b):
+        # Karatsuba only pays off for coefficients whose arithmetic
+        # simplifies (numbers, nested Polynomials, ...). On general
+        # expressions, it would trade multiplications for unsimplified sums.
+        return _from_dense(a_low+b_low, _multiply_karatsuba(a, b))
+
+    return _multiply_schoolbook(a_data, b_data)
+
+# }}}
+
+
+
+
+# {{{ sparse coefficient storage
+
+def _add_sparse_arrays(a, b):
+    """Add polynomials given as tuples *(exponents, coefficients)* of
+    parallel tuples sorted by exponent, returning the same form. Sums of
+    coefficients that vanish are dropped.
+    """
+    from bisect import bisect_left
+
+    a_exps, a_coeffs = a
+    b_exps, b_coeffs = b
+
+    if not b_exps:
+        return a
+    if not a_exps:
+        return b
+
+    # {{{ disjoint exponent ranges: concatenate
+
+    if a_exps[-1] < b_exps[0]:
+        return a_exps + b_exps, a_coeffs + b_coeffs
+    if b_exps[-1] < a_exps[0]:
+        return b_exps + a_exps, b_coeffs + a_coeffs
+
+    # }}}
+
+    # {{{ single term: insert
+
+    if len(b_exps) == 1:
+        exp, = b_exps
+        i = bisect_left(a_exps, exp)
+        if a_exps[i] != exp:
+            return (
+                    a_exps[:i] + b_exps + a_exps[i:],
+                    a_coeffs[:i] + b_coeffs + a_coeffs[i:])
+
+        coeff = a_coeffs[i] + b_coeffs[0]
+        if coeff:
+            return a_exps, a_coeffs[:i] + (coeff,) + a_coeffs[i+1:]
+        else:
+            return a_exps[:i] + a_exps[i+1:], a_coeffs[:i] + a_coeffs[i+1:]
+
+    # }}}
+
+    exps = []
+    coeffs = []
+
+    i = 0
+    j = 0
+    len_a = len(a_exps)
+    len_b = len(b_exps)
+    while i < len_a and j < len_b:
+        a_exp = a_exps[i]
+        b_exp = b_exps[j]
+        if a_exp == b_exp:
+            coeff = a_coeffs[i] + b_coeffs[j]
+            if coeff:
+                exps.append(a_exp)
+                coeffs.append(coeff)
+            i += 1
+            j += 1
+        elif a_exp < b_exp:
+            exps.append(a_exp)
+            coeffs.append(a_coeffs[i])
+            i += 1
+        else:
+            exps.append(b_exp)
+            coeffs.append(b_coeffs[j])
+            j += 1
+
+    # at least one side is exhausted, append the rest of the other
+    exps.extend(a_exps[i:])
+    coeffs.extend(a_coeffs[i:])
+    exps.extend(b_exps[j:])
+    coeffs.extend(b_coeffs[j:])
+
+    return tuple(exps), tuple(coeffs)
+
+# }}}
+
+
+# {{{ dense numpy-backed coefficient storage
+
+def _trim_dense(coeffs):
+    nonzero, = numpy.nonzero(coeffs)
+    if len(nonzero) == 0:
+        return coeffs[:0]
+    return coeffs[:nonzero[-1]+1]
+
+
+def _is_dense_array(data):
+    return (numpy is not None
+            and isinstance(data, numpy.ndarray)
+            and data.ndim == 1
+            and data.dtype.kind in "biufc")
+
+
+def _as_dense_array(x, base):
+    """Return the coefficients of *x* (a number, or a :class:`Polynomial` in
+    *base*) as a dense :mod:`numpy` array indexed by exponent, or *None* if
+    that is not possible.
+    """
+    if numpy is None:
+        return None
+
+    if not isinstance(x, Polynomial):
+        if _is_number(x):
+            return numpy.array([x])
+        return None
+
+    if x.Base != base:
+        return None
+    if x.DenseData is not None:
+        return x.DenseData
+
+    data = x.Data
+    if not data:
+        return numpy.zeros(0)
+    if data[0][0] < 0 or not all(_is_number(coeff) for exp, coeff in data):
+        return None
+
+    coeffs = numpy.array([coeff for exp, coeff in data])
+    if coeffs.dtype.kind not in "biufc":
+        # e.g. integers too large for int64
+        return None
+
+    result = numpy.zeros(data[-1][0]+1, dtype=coeffs.dtype)
+    result[[exp for exp, coeff in data]] = coeffs
+    return result
+
+
+def _add_dense_arrays(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    result = a.astype(numpy.result_type(a, b))
+    result[:len(b)] += b
+    return result
+
+
+def _divmod_dense_arrays(a, b):
+    """Divide *a* by *b* (both dense coefficient arrays) with remainder.
+    The coefficients are treated as elements of a field.
+
+    :raises ZeroDivisionError: if *b* is zero.
+    """
+    b = _trim_dense(b)
+    if not len(b):
+        raise ZeroDivisionError("polynomial division by zero")
+
+    n = len(a)
+    m = len(b)
+
+    dtype = numpy.result_type(a, b, numpy.float64)
+    if n < m:
+        return numpy.zeros(0, dtype), a.astype(dtype)
+
+    rem = a.astype(dtype)
+    quot = numpy.empty(n-m+1, dtype)
+    lead_coeff = b[-1]
+    for i in range(n-m, -1, -1):
+        quot[i] = factor = rem[i+m-1] / lead_coeff
+        rem[i:i+m] -= factor*b
+
+    return quot, rem[:m-1]
+
+
+def _horner_dense(coeffs, x):
+    if numpy is not None and (
+            _is_number(x) or isinstance(x, numpy.ndarray)):
+        from numpy.polynomial.polynomial import polyval
+        return polyval(x, coeffs)
+
+    result = 0
+    for coeff in coeffs.tolist()[::-1]:
+        result = result*x + coeff
+    return result
+
+# }}}
+
+
+# {{{ evaluation
+
+def _can_update_in_place(result, *operands):
+    return (isinstance(result, numpy.ndarray)
+            and numpy.can_cast(
+                numpy.result_type(result, *operands), result.dtype)
+            and numpy.broadcast(result, *operands).shape == result.shape)
+
+
+def _horner(data, x, evaluate_coefficient):
+    """Evaluate the polynomial with the sparse coefficient *data* at *x* by
+    Horner's scheme, where *evaluate_coefficient* is applied to each
+    coefficient. If *x* is a :mod:`numpy` array, the steps are carried out
+    in place on a single result array whenever possible.
+    """
+    if not data:
+        return 0
+
+    powers = {1: x}
+
+    def power(n):
+        try:
+            return powers[n]
+        except KeyError:
+            result = powers[n] = x**n
+            return result
+
+    rev_data = data[::-1]
+    result = evaluate_coefficient(rev_data[0][1])
+    owns_result = False
+
+    for (exp, _), (next_exp, coeff) in zip(rev_data, rev_data[1:]):
+        coeff = evaluate_coefficient(coeff)
+        gap_power = power(exp - next_exp)
+
+        if owns_result and _can_update_in_place(result, gap_power, coeff):
+            result *= gap_power
+            result += coeff
+        else:
+            result = result*gap_power + coeff
+            owns_result = numpy is not None and isinstance(result, numpy.ndarray)
+
+    lowest_exp = rev_data[-1][0]
+    if lowest_exp:
+        result = result*power(lowest_exp)
+
+    return result
+
+
+# Points are evaluated in blocks of this many, so that the intermediate
+# results of Horner's scheme stay in cache.
+BATCH_EVALUATION_BLOCK_SIZE = 2**16
+
+
+def _evaluate_batch(poly, context):
+    from pymbolic import evaluate
+
+    def evaluate_coefficient(coeff):
+        if isinstance(coeff, Polynomial):
+            return _evaluate_batch(coeff, context)
+        elif _is_number(coeff):
+            return coeff
+        else:
+            return evaluate(coeff, context)
+
+    x = evaluate(poly.Base, context)
+    if poly.DenseData is not None:
+        return _horner_dense(poly.DenseData, x)
+
+    return _horner(poly.Data, x, evaluate_coefficient)
+
+
+def evaluate_batch(poly, context, block_size=BATCH_EVALUATION_BLOCK_SIZE):
+    """Evaluate the :class:`Polynomial` *poly* at many points at once.
+
+    :arg context: a mapping from variable names to their values, typically
+        :mod:`numpy` arrays holding one value per point. The arrays for
+        different variables must broadcast against each other.
+    :arg block_size: the number of points evaluated at a time.
+
+    Coefficients that are themselves :class:`Polynomial` instances (in other
+    bases, as created by arithmetic on multivariate polynomials) are
+    evaluated recursively, other non-numerical coefficients by
+    :func:`pymbolic.evaluate`.
+    """
+    arrays = {}
+    if numpy is not None:
+        arrays = dict(
+                (name, value) for name, value in context.items()
+                if isinstance(value, numpy.ndarray))
+
+    if not arrays:
+        return _evaluate_batch(poly, context)
+
+    shape = numpy.broadcast(*arrays.values()).shape
+    size = int(numpy.prod(shape))
+    if size <= block_size or any(
+            ary.shape != shape for ary in arrays.values()):
+        # Blocking would forfeit the savings from evaluating coefficients
+        # on broadcast (lower-dimensional) arrays.
+        result = _evaluate_batch(poly, context)
+        if numpy.shape(result) != shape:
+            # e.g. for constant polynomials
+            result = numpy.array(numpy.broadcast_to(result, shape))
+        return result
+
+    flat_arrays = dict(
+            (name, ary.reshape(-1)) for name, ary in arrays.items())
+
+    blocks = []
+    for start in range(0, size, block_size):
+        block_context = dict(context)
+        block_context.update(
+                (name, ary[start:start+block_size])
+                for name, ary in flat_arrays.items())
+
+        block = _evaluate_batch(poly, block_context)
+        blocks.append(numpy.broadcast_to(block, (min(block_size, size-start),)))
+
+    return numpy.concatenate(blocks).reshape(shape)
+
+# }}}
+
+
+# {{{ division and gcd
+
+def _divmod_data(a_data, b_data, coeffs_are_field):
+    """Divide the sparse coefficient data *a_data* by *b_data* (which must
+    not be empty), returning *(quot_data, rem_data)*.
+
+    The remainder is kept in a single buffer mapping exponents to
+    coefficients, together with a heap of its exponents, and is updated in
+    place. If *coeffs_are_field* is false and a leading coefficient of the
+    remainder is not divisible by that of *b_data*, division stops early
+    and the partial quotient and remainder are returned.
+    """
+    from heapq import heapify, heappush, heappop
+    from pymbolic.primitives import quotient
+
+    rem = dict(a_data)
+    exps = [-exp for exp in rem]
+    heapify(exps)
+
+    lead_exp, lead_coeff = b_data[-1]
+    lower_data = b_data[:-1]
+
+    quot_data = []
+    while exps:
+        exp = -heappop(exps)
+        coeff = rem[exp]
+        if not coeff:
+            del rem[exp]
+            continue
+
+        if exp < lead_exp:
+            heappush(exps, -exp)
+            break
+
+        if coeffs_are_field:
+            factor = quotient(coeff, lead_coeff)
+        else:
+            factor, lead_rem = divmod(coeff, lead_coeff)
+            if lead_rem:
+                heappush(exps, -exp)
+                break
+
+        # the leading term cancels by construction
+        del rem[exp]
+        deg_diff = exp - lead_exp
+        quot_data.append((deg_diff, factor))
+
+        for b_exp, b_coeff in lower_data:
+            rem_exp = deg_diff + b_exp
+            if rem_exp in rem:
+                rem[rem_exp] = rem[rem_exp] - factor*b_coeff
             else:
-                uniq_result[-1] = last_exp, newcoeff
+                rem[rem_exp] = -(factor*b_coeff)
+                heappush(exps, -rem_exp)
+
+    return (
+            tuple(quot_data[::-1]),
+            tuple((exp, rem[exp]) for exp in sorted(rem) if rem[exp]))
+
+
+# Primes for the modular gcd are taken from below this bound, so that
+# products of residues fit into 64-bit integers.
+MODULAR_GCD_PRIME_BOUND = 2**31
 
+
+def _trim_zeros(coeffs):
+    n = len(coeffs)
+    while n and not coeffs[n-1]:
+        n -= 1
+    return coeffs[:n]
+
+
+def _rem_mod_p(a, b, p):
+    """Return the remainder of the dense coefficient sequences *a* by *b*
+    (both reduced mod *p*, *b* without leading zeros) modulo the prime *p*.
+    The remainder is computed in place in a copy of *a*.
+    """
+    m = len(b)
+    lead_inv = pow(int(b[-1]), p-2, p)
+
+    rem = a.copy()
+    for i in range(len(a)-m, -1, -1):
+        factor = int(rem[i+m-1]) * lead_inv % p
+        if not factor:
+            continue
+
+        if numpy is not None:
+            rem[i:i+m] = (rem[i:i+m] - factor*b) % p
         else:
-            uniq_result.append((exp, coeff))
-            last_exp = exp
-    return uniq_result
+            rem[i:i+m] = [
+                    (rem_coeff - factor*b_coeff) % p
+                    for rem_coeff, b_coeff in zip(rem[i:i+m], b)]
+
+    return _trim_zeros(rem[:m-1])
+
+
+def _monic_gcd_mod_p(a, b, p):
+    if numpy is not None:
+        a = numpy.array([coeff % p for coeff in a], dtype=numpy.int64)
+        b = numpy.array([coeff % p for coeff in b], dtype=numpy.int64)
+    else:
+        a = [coeff % p for coeff in a]
+        b = [coeff % p for coeff in b]
+
+    a = _trim_zeros(a)
+    b = _trim_zeros(b)
+    if len(a) < len(b):
+        a, b = b, a
+
+    while len(b):
+        a, b = b, _rem_mod_p(a, b, p)
+
+    lead_inv = pow(int(a[-1]), p-2, p)
+    return [int(coeff) * lead_inv % p for coeff in a]
+
+
+def _content(coeffs):
+    from math import gcd
+    from six.moves import reduce
+    return reduce(gcd, coeffs, 0)
+
+
+def _integer_gcd_data(a_data, b_data):
+    """Return the data of the gcd of the polynomials with integer coefficients
+    and nonnegative exponents given by *a_data* and *b_data*, with a positive
+    leading coefficient.
+
+    Uses the small-primes modular algorithm: the monic gcds modulo
+    several primes are combined by Chinese remaindering until the
+    result stabilizes and is verified by trial division.
+    """
+    a_data = tuple((exp, coeff) for exp, coeff in a_data if coeff)
+    b_data = tuple((exp, coeff) for exp, coeff in b_data if coeff)
+
+    if not a_data or not b_data:
+        data = a_data or b_data
+        if data and data[-1][1] < 0:
+            data = tuple((exp, -coeff) for exp, coeff in data)
+        return data
+
+    # factor out the largest common power of the base
+    shift = min(a_data[0][0], b_data[0][0])
+    _, a = _to_dense(a_data)
+    _, b = _to_dense(b_data)
+
+    a_content = _content(a)
+    b_content = _content(b)
+    a = [coeff // a_content for coeff in a]
+    b = [coeff // b_content for coeff in b]
+
+    from math import gcd
+    content = gcd(a_content, b_content)
+
+    def make_data(coeffs):
+        if coeffs[-1] < 0:
+            coeffs = [-coeff for coeff in coeffs]
+        return _from_dense(shift, [content*coeff for coeff in coeffs])
+
+    if len(a) == 1 or len(b) == 1:
+        return make_data([1])
+
+    a_sparse = _from_dense(0, a)
+    b_sparse = _from_dense(0, b)
+
+    # The leading coefficient of the gcd divides lead_gcd, so scaling the
+    # monic modular gcds by lead_gcd makes them images of an integer
+    # multiple of the gcd.
+    lead_gcd = gcd(a[-1], b[-1])
+
+    result = None
+    modulus = None
+    for p in algorithm._iter_primes_below(MODULAR_GCD_PRIME_BOUND):
+        if lead_gcd % p == 0:
+            continue
+
+        image = _monic_gcd_mod_p(a, b, p)
+        if len(image) == 1:
+            return make_data([1])
+
+        image = [coeff * lead_gcd % p for coeff in image]
+
+        if result is not None and len(image) > len(result):
+            # unlucky prime
+            continue
+
+        if result is None or len(image) < len(result):
+            # all previous primes were unlucky
+            result = [
+                    coeff - p if 2*coeff > p else coeff
+                    for coeff in image]
+            modulus = p
+            continue
+
+        # {{{ chinese remaindering
+
+        modulus_inv = pow(modulus % p, p-2, p)
+        new_modulus = modulus * p
+        new_result = []
+        for coeff, image_coeff in zip(result, image):
+            coeff = coeff + modulus * (
+                    (image_coeff - coeff) * modulus_inv % p)
+            if 2*coeff > new_modulus:
+                coeff -= new_modulus
+            new_result.append(coeff)
+
+        # }}}
+
+        stable = new_result == result
+        result = new_result
+        modulus = new_modulus
+
+        if stable:
+            candidate_content = _content(result)
+            candidate = _from_dense(
+                    0, [coeff // candidate_content for coeff in result])
+            if (not _divmod_data(a_sparse, candidate, False)[1]
+                    and not _divmod_data(b_sparse, candidate, False)[1]):
+                return make_data(_to_dense(candidate)[1])
+
+
+def polynomial_gcd(a, b):
+    """Return the greatest common divisor of the :class:`Polynomial`
+    instances *a* and *b*.
+
+    If both have the same base and integer coefficients, the gcd is computed
+    by a modular algorithm and has a positive leading coefficient. Otherwise,
+    it is found by :func:`pymbolic.algorithm.extended_euclidean`.
+    """
+    def has_integer_coefficients(poly):
+        return all(
+                exp >= 0 and _is_int(coeff)
+                for exp, coeff in poly.Data)
+
+    if (isinstance(a, Polynomial) and isinstance(b, Polynomial)
+            and a.Base == b.Base
+            and has_integer_coefficients(a)
+            and has_integer_coefficients(b)):
+        return Polynomial(a.Base, _integer_gcd_data(a.Data, b.Data),
+                a.Unit, a.VarLess)
+
+    return algorithm.extended_euclidean(a, b)[0]
+
+# }}}
 
 
 
@@ -81,43 +799,145 @@ class LexicalMonomialOrder:
 
 
 class Polynomial(Expression):
+    """A univariate polynomial in *base*.
+
+    *data* is a sequence of ``(exponent, coefficient)`` tuples, sorted by
+    increasing exponent, with one entry per exponent.
+
+    Alternatively, *data* may be a one-dimensional :mod:`numpy` array of
+    numerical coefficients, indexed by exponent. The polynomial is then
+    stored in dense mode, in which arithmetic with other dense (or sparse,
+    numerical) polynomials in the same *base*, :func:`differentiate`,
+    :func:`integrate` and evaluation are carried out by :mod:`numpy`. Dense
+    mode is kept by the results of these operations. See also
+    :meth:`to_dense` and :meth:`to_sparse`.
+    """
+
     def __init__(self, base, data=None, unit=1, var_less=LexicalMonomialOrder()):
         self.Base = base
         self.Unit = unit
         self.VarLess = var_less
 
-        # list of (exponent, coefficient tuples)
-        # sorted in increasing order
-        # one entry per degree
+        # In dense mode, the coefficients are kept in a numpy array, and the
+        # sparse form is derived from it on demand.
+        self.DenseData = None
+
+        # The sparse form is kept as a tuple of (exponent, coefficient)
+        # tuples and/or as parallel tuples of exponents and coefficients,
+        # each derived from the other on demand. Either way, exponents are
+        # sorted in increasing order, with one entry per degree.
+        self._sparse_data = None
+        self._exponents = None
+        self._coefficients = None
+
         if data is None:
-            self.Data = ((1, unit),)
+            self._exponents = (1,)
+            self._coefficients = (unit,)
+        elif _is_dense_array(data):
+            self.DenseData = _trim_dense(data)
         else:
-            self.Data = tuple(data)
+            self._sparse_data = tuple(data)
 
         # Remember the Zen, Luke: Sparse is better than dense.
 
+    @classmethod
+    def _from_arrays(cls, base, exponents, coefficients,
+            unit=1, var_less=LexicalMonomialOrder()):
+        result = cls(base, (), unit, var_less)
+        result._sparse_data = None
+        result._exponents = exponents
+        result._coefficients = coefficients
+        return result
+
+    def _get_arrays(self):
+        """Return a tuple *(exponents, coefficients)* of parallel tuples."""
+        if self._exponents is None:
+            if self._sparse_data is None:
+                dense_data = self.DenseData
+                exponents, = numpy.nonzero(dense_data)
+                self._exponents = tuple(exponents.tolist())
+                self._coefficients = tuple(dense_data[exponents].tolist())
+            elif self._sparse_data:
+                self._exponents, self._coefficients = (
+                        tuple(column) for column in zip(*self._sparse_data))
+            else:
+                self._exponents = self._coefficients = ()
+
+        return self._exponents, self._coefficients
+
+    def _get_sparse_data(self):
+        if self._sparse_data is None:
+            self._sparse_data = tuple(zip(*self._get_arrays()))
+        return self._sparse_data
+    Data = property(_get_sparse_data)
+
+    @property
+    def is_dense(self):
+        return self.DenseData is not None
+
+    def to_dense(self):
+        """Return a dense-mode copy of *self*.
+
+        :raises ValueError: if *self* has non-numerical coefficients or
+            negative exponents.
+        """
+        if self.DenseData is not None:
+            return self
+
+        coeffs = _as_dense_array(self, self.Base)
+        if coeffs is None:
+            raise ValueError("polynomial cannot be stored in dense mode")
+        return Polynomial(self.Base, coeffs, self.Unit, self.VarLess)
+
+    def to_sparse(self):
+        """Return a copy of *self* that is not in dense mode."""
+        return Polynomial(self.Base, self.Data, self.Unit, self.VarLess)
+
+    def _dense_binary_op(self, other, op):
+        if self.DenseData is None and not (
+                isinstance(other, Polynomial) and other.DenseData is not None):
+            return None
+
+        a = _as_dense_array(self, self.Base)
+        b = _as_dense_array(other, self.Base)
+        if a is None or b is None:
+            return None
+
+        return Polynomial(self.Base, op(a, b), self.Unit, self.VarLess)
+
     def coefficients(self):
-        return [coeff for (exp, coeff) in self.Data]
+        return list(self._get_arrays()[1])
 
     def traits(self):
         return PolynomialTraits()
 
     def __nonzero__(self):
-        return len(self.Data) != 0
+        if self.DenseData is not None:
+            return len(self.DenseData) != 0
+        return len(self._get_arrays()[0]) != 0
+
+    __bool__ = __nonzero__
 
     def __eq__(self, other):
         return isinstance(other, Polynomial) \
                and (self.Base == other.Base) \
-               and (self.Data == other.Data)
+               and (self._get_arrays() == other._get_arrays())
     def __ne__(self, other):
         return not self.__eq__(other)
 
     def __neg__(self):
-        return Polynomial(self.Base,
-                          [(exp, -coeff)
-                           for (exp, coeff) in self.Data])
+        if self.DenseData is not None:
+            return Polynomial(self.Base, -self.DenseData, self.Unit, self.VarLess)
+
+        exponents, coefficients = self._get_arrays()
+        return Polynomial._from_arrays(self.Base, exponents,
+                tuple(-coeff for coeff in coefficients))
 
     def __add__(self, other):
+        result = self._dense_binary_op(other, _add_dense_arrays)
+        if result is not None:
+            return result
+
         if not other:
             return self
 
@@ -132,38 +952,9 @@ class Polynomial(Expression):
             else:
                 return other.__add__(self)
 
-        iself = 0
-        iother = 0
-
-        result = []
-        while iself < len(self.Data) and iother < len(other.Data):
-            exp_self = self.Data[iself][0]
-            exp_other = other.Data[iother][0]
-            if exp_self == exp_other:
-                coeff = self.Data[iself][1] + other.Data[iother][1]
-                if coeff:
-                    result.append((exp_self, coeff))
-                iself += 1
-                iother += 1
-            elif exp_self > exp_other:
-                result.append((exp_other, other.Data[iother][1]))
-                iother += 1
-            elif exp_self < exp_other:
-                result.append((exp_self, self.Data[iself][1]))
-                iself += 1
-
-        # we have exhausted at least one list, exhaust the other
-        while iself < len(self.Data):
-            exp_self = self.Data[iself][0]
-            result.append((exp_self, self.Data[iself][1]))
-            iself += 1
-
-        while iother < len(other.Data):
-            exp_other = other.Data[iother][0]
-            result.append((exp_other, other.Data[iother][1]))
-            iother += 1
-
-        return Polynomial(self.Base, tuple(result))
+        exponents, coefficients = _add_sparse_arrays(
+                self._get_arrays(), other._get_arrays())
+        return Polynomial._from_arrays(self.Base, exponents, coefficients)
 
     def __radd__(self, other):
         return self.__add__(other)
@@ -172,41 +963,61 @@ class Polynomial(Expression):
         return self+(-other)
 
     def __rsub__(self, other):
-        return (-other)+self
+        return (-self)+other
 
     def __mul__(self, other):
+        result = self._dense_binary_op(other, _multiply_numpy)
+        if result is not None:
+            return result
+
         if not isinstance(other, Polynomial):
             if other == self.Base:
                 other = Polynomial(self.Base)
             else:
-                return Polynomial(self.Base, [(exp, coeff * other)
-                                              for exp, coeff in self.Data])
+                return self._scale(other)
 
         if other.Base != self.Base:
             assert self.VarLess == other.VarLess
 
             if self.VarLess(self.Base, other.Base):
-                return Polynomial(self.Base, [(exp, coeff * other)
-                                              for exp, coeff in self.Data])
+                return self._scale(other)
             else:
                 return other.__mul__(self)
 
-        result = []
-        for s_exp, s_coeff in self.Data:
-            for o_exp, o_coeff in other.Data:
-                result.append((s_exp+o_exp, s_coeff*o_coeff))
-
-        return Polynomial(self.Base, tuple(_sort_uniq(result)))
+        return Polynomial(self.Base, _multiply_data(self.Data, other.Data))
 
     def __rmul__(self, other):
-        return Polynomial(self.Base, [(exp, other * coeff)
-                                      for exp, coeff in self.Data])
+        result = self._dense_binary_op(other, _multiply_numpy)
+        if result is not None:
+            return result
+
+        return self._scale(other, from_left=True)
+
+    def _scale(self, factor, from_left=False):
+        exponents, coefficients = self._get_arrays()
+        if from_left:
+            coefficients = tuple(factor * coeff for coeff in coefficients)
+        else:
+            coefficients = tuple(coeff * factor for coeff in coefficients)
+        return Polynomial._from_arrays(self.Base, exponents, coefficients)
 
     def __pow__(self, other):
         return algorithm.integer_power(self, int(other),
                                        Polynomial(self.Base, ((0, 1),)))
 
     def __divmod__(self, other):
+        if isinstance(other, Polynomial) or self.DenseData is not None:
+            a = _as_dense_array(self, self.Base)
+            b = _as_dense_array(other, self.Base)
+            if (a is not None and b is not None
+                    and (self.DenseData is not None
+                        or isinstance(other, Polynomial)
+                        and other.DenseData is not None)):
+                quot, rem = _divmod_dense_arrays(a, b)
+                return (
+                        Polynomial(self.Base, quot, self.Unit, self.VarLess),
+                        Polynomial(self.Base, rem, self.Unit, self.VarLess))
+
         if not isinstance(other, Polynomial):
             dm_list = [(exp, divmod(coeff, other)) for exp, coeff in self.Data]
             return Polynomial(self.Base, [(exp, quot) for (exp, (quot, rem)) in dm_list]),\
@@ -227,27 +1038,12 @@ class Polynomial(Expression):
         if other.degree == -1:
             raise ZeroDivisionError
 
-        quot = Polynomial(self.Base, ())
-        rem = self
-        other_lead_coeff = other.Data[-1][1]
-        other_lead_exp = other.Data[-1][0]
-
-
         coeffs_are_field = isinstance(traits(self.Unit), FieldTraits)
-        from pymbolic.primitives import quotient
-        while rem.degree >= other.degree:
-            if coeffs_are_field:
-                coeff_factor = quotient(rem.Data[-1][1], other_lead_coeff)
-            else:
-                coeff_factor, lead_rem = divmod(rem.Data[-1][1], other_lead_coeff)
-                if lead_rem:
-                    return quot, rem
-            deg_diff = rem.Data[-1][0] - other_lead_exp
-
-            this_fac = Polynomial(self.Base, ((deg_diff, coeff_factor),))
-            quot += this_fac
-            rem -= this_fac * other
-        return quot, rem
+        quot_data, rem_data = _divmod_data(
+                self.Data, other.Data, coeffs_are_field)
+        return (
+                Polynomial(self.Base, quot_data),
+                Polynomial(self.Base, rem_data))
 
     def __div__(self, other):
         if not isinstance(other, Polynomial):
@@ -278,10 +1074,13 @@ class Polynomial(Expression):
     unit = property(_unit)
 
     def _degree(self):
-        try:
-            return self.Data[-1][0]
-        except IndexError:
+        if self.DenseData is not None:
+            return len(self.DenseData) - 1
+
+        exponents = self._get_arrays()[0]
+        if not exponents:
             return -1
+        return exponents[-1]
     degree = property(_degree)
 
     def __getinitargs__(self):
@@ -295,16 +1094,47 @@ class Polynomial(Expression):
         return pymbolic.evaluate(self, context)
 
     def get_coefficient(self, sought_exp):
-        # FIXME use bisection
-        for exp, coeff in self.Data:
-            if exp == sought_exp:
-                return coeff
+        if self.DenseData is not None:
+            if 0 <= sought_exp < len(self.DenseData):
+                return self.DenseData[sought_exp].item()
+            return 0
+
+        from bisect import bisect_left
+        exponents, coefficients = self._get_arrays()
+        i = bisect_left(exponents, sought_exp)
+        if i < len(exponents) and exponents[i] == sought_exp:
+            return coefficients[i]
         return 0
 
+    def slice_degrees(self, start=None, stop=None):
+        """Return the :class:`Polynomial` made up of the terms of *self*
+        whose exponent *exp* satisfies ``start <= exp < stop``. Either bound
+        may be *None* to leave that side unbounded.
+        """
+        if self.DenseData is not None:
+            start = max(start or 0, 0)
+            coeffs = self.DenseData[:stop].copy()
+            coeffs[:start] = 0
+            return Polynomial(self.Base, coeffs, self.Unit, self.VarLess)
+
+        from bisect import bisect_left
+        exponents, coefficients = self._get_arrays()
+        begin = 0 if start is None else bisect_left(exponents, start)
+        end = len(exponents) if stop is None else bisect_left(exponents, stop)
+        return Polynomial._from_arrays(self.Base,
+                exponents[begin:end], coefficients[begin:end],
+                self.Unit, self.VarLess)
+
 
 
 
 def differentiate(poly):
+    if poly.DenseData is not None:
+        coeffs = poly.DenseData
+        return Polynomial(poly.base,
+                coeffs[1:] * numpy.arange(1, len(coeffs)),
+                poly.unit, poly.VarLess)
+
     return Polynomial(
         poly.base,
         tuple((exp-1, exp*coeff)
@@ -314,6 +1144,14 @@ def differentiate(poly):
 
 
 def integrate(poly):
+    if poly.DenseData is not None:
+        coeffs = poly.DenseData
+        return Polynomial(poly.base,
+                numpy.concatenate([
+                    numpy.zeros(1, coeffs.dtype),
+                    coeffs / numpy.arange(1, len(coeffs)+1)]),
+                poly.unit, poly.VarLess)
+
     return Polynomial(
         poly.base,
         tuple((exp+1, pymbolic.quotient(poly.unit, (exp+1))*coeff)
@@ -351,6 +1189,10 @@ class PolynomialTraits(EuclideanRingTraits):
     def norm(x):
         return x.degree
 
+    @staticmethod
+    def gcd(q, r):
+        return polynomial_gcd(q, r)
+
     @staticmethod
     def get_unit(x):
         lc = leading_coefficient(x)
@@ -1508,17 +1508,18 @@ def subscript(expression, index):
 
 def flattened_sum(components):
     # flatten any potential sub-sums
-    queue = list(components)
+    from collections import deque
+    queue = deque(components)
     done = []
 
     while queue:
-        item = queue.pop(0)
+        item = queue.popleft()
 
         if is_zero(item):
             continue
 
         if isinstance(item, Sum):
-            queue += item.children
+            queue.extend(item.children)
         else:
             done.append(item)
 
@@ -1538,11 +1539,12 @@ def linear_combination(coefficients, expressions):
 
 def flattened_product(components):
     # flatten any potential sub-products
-    queue = list(components)
+    from collections import deque
+    queue = deque(components)
     done = []
 
     while queue:
-        item = queue.pop(0)
+        item = queue.popleft()
 
         if is_zero(item):
             return 0
@@ -1550,7 +1552,7 @@ def flattened_product(components):
             continue
 
         if isinstance(item, Product):
-            queue += item.children
+            queue.extend(item.children)
         else:
             done.append(item)
 
@@ -203,6 +203,87 @@ def test_fft():
     for i, line in enumerate(code):
         print("result[%d] = %s" % (i, line))
 
+
+@pytest.mark.parametrize("n", [1, 6, 17, 20, 45])
+@pytest.mark.parametrize("sign", [1, -1])
+def test_fft_symbolic(n, sign):
+    numpy = pytest.importorskip("numpy")
+    import numpy.linalg as la
+
+    from pymbolic import var, evaluate
+    from pymbolic.algorithm import fft
+
+    x = numpy.array([var("x%d" % i) for i in range(n)], dtype=object)
+    x_values = numpy.random.rand(n) + 1j*numpy.random.rand(n)
+    context = dict(("x%d" % i, x_i) for i, x_i in enumerate(x_values))
+
+    if sign == 1:
+        ref = numpy.fft.fft(x_values)
+    else:
+        ref = n*numpy.fft.ifft(x_values)
+
+    wrapped = []
+
+    def wrap_intermediate(vec):
+        wrapped.append(len(vec))
+        return vec
+
+    f_x = fft(x, sign, wrap_intermediate)
+    assert all(length == n for length in wrapped)
+
+    f_x_values = numpy.array([evaluate(f_x_i, context) for f_x_i in f_x])
+    assert la.norm(f_x_values - ref) < 1e-10
+
+    # object arrays of numbers
+    assert la.norm(fft(x_values.astype(object), sign) - ref) < 1e-10
+
+
+def test_sym_fft():
+    numpy = pytest.importorskip("numpy")
+    import numpy.linalg as la
+
+    from pymbolic import var, evaluate
+    from pymbolic.algorithm import sym_fft
+    from pymbolic.mapper import CombineMapper
+    from pymbolic.mapper.c_code import CCodeMapper
+    from pymbolic.mapper.stringifier import PREC_NONE
+
+    class ConstantCollector(CombineMapper):
+        def combine(self, values):
+            return set().union(*values)
+
+        def map_constant(self, expr):
+            return set([complex(expr)])
+
+        def map_variable(self, expr):
+            return set()
+
+        def map_common_subexpression(self, expr):
+            return self.rec(expr.child)
+
+    n = 24
+    x_values = numpy.random.rand(n) + 1j*numpy.random.rand(n)
+
+    # the second call reuses the transform derived in the first
+    for name in ["x", "y"]:
+        x = numpy.array([var("%s%d" % (name, i)) for i in range(n)],
+                dtype=object)
+        f_x = sym_fft(x)
+
+        context = dict(("%s%d" % (name, i), x_i)
+                for i, x_i in enumerate(x_values))
+        f_x_values = numpy.array([evaluate(f_x_i, context) for f_x_i in f_x])
+        assert la.norm(f_x_values - numpy.fft.fft(x_values)) < 1e-10
+
+        for constant in ConstantCollector()(list(f_x)):
+            for part in [constant.real, constant.imag]:
+                assert part == 0 or abs(part) > 1e-15
+
+        ccm = CCodeMapper()
+        code = [ccm(f_x_i, PREC_NONE) for f_x_i in f_x]
+        assert len(ccm.cse_name_list) > n
+        assert all("_cse" in line for line in code)
+
 # }}}
 
 
@@ -225,6 +306,39 @@ def test_sparse_multiply():
     assert la.norm(mat_vec-mat_vec_2) < 1e-14
 
 
+def test_csr_matrix_multiply():
+    from collections import namedtuple
+    import numpy as np
+    from pymbolic.algorithm import csr_matrix_multiply
+
+    # the attributes of scipy.sparse.csr_matrix that are used
+    CSRMatrix = namedtuple("CSRMatrix", "shape data indices indptr")  # noqa
+    mat = CSRMatrix(
+            shape=(3, 3),
+            data=np.array([2., 1., 0., 3.]),
+            indices=np.array([0, 2, 1, 0]),
+            indptr=np.array([0, 2, 2, 4]))
+
+    x, y, z = [prim.Variable(name) for name in "xyz"]
+    vec = np.array([x, y + z, z], dtype=object)
+
+    for max_workers in [None, 2]:
+        result = csr_matrix_multiply(mat, vec, max_workers=max_workers)
+        assert result.dtype == object
+        assert list(result) == [prim.Sum((2.*x, z)), 0, 3.*x]
+
+    result = csr_matrix_multiply(mat, np.array([1, 2, 3], dtype=object))
+    assert list(result) == [5, 0, 3]
+
+    sparse = pytest.importorskip("scipy.sparse")
+    mat = sparse.random(50, 40, density=0.1, format="csr", random_state=17)
+    vec = np.linspace(0, 1, 40)
+    for max_workers in [None, 3]:
+        assert np.allclose(
+                csr_matrix_multiply(mat, vec, max_workers=max_workers),
+                mat.toarray().dot(vec))
+
+
 # {{{ parser
 
 def test_parser():
@@ -663,6 +777,767 @@ def test_differentiator_flags_for_nonsmooth_and_discontinuous():
     assert result == 0
 
 
+def test_cse_cost_model():
+    from pymbolic import var
+    from pymbolic.cse import tag_common_subexpressions
+    from pymbolic.mapper.flop_counter import FlopCounter
+
+    x, y, z = var("x"), var("y"), var("z")
+    exprs = [(x+y)*z, z*(y+x), x*y]
+
+    cse_exprs = tag_common_subexpressions(exprs)
+    assert isinstance(cse_exprs[0].children[0], prim.CommonSubexpression)
+    assert cse_exprs[0].children[0] is cse_exprs[1].children[1]
+
+    # reusing x+y saves a single flop, not enough to pay off here
+    cse_exprs = tag_common_subexpressions(
+            exprs, cost_model=FlopCounter(), min_savings=1)
+    assert cse_exprs == exprs
+
+    cse_exprs = tag_common_subexpressions(
+            exprs + [x+y], cost_model=FlopCounter(), min_savings=1)
+    assert isinstance(cse_exprs[-1], prim.CommonSubexpression)
+
+
+def test_partial_cse():
+    from pymbolic import var, evaluate
+    from pymbolic.cse import tag_common_partial_subexpressions
+    from pymbolic.mapper.flop_counter import FlopCounter, CSEAwareFlopCounter
+
+    a, b, c, d, e = [var(name) for name in "abcde"]
+    exprs = [a*b*c, a*b*d, 2*a*b*c*e, a+b+c, (c+b+e)*a]
+
+    result, ops_saved = tag_common_partial_subexpressions(exprs)
+    assert ops_saved == 4
+
+    flops_before = sum(FlopCounter()(expr) for expr in exprs)
+    cse_counter = CSEAwareFlopCounter()
+    flops_after = sum(cse_counter(expr) for expr in result)
+    assert flops_before - flops_after == ops_saved
+
+    context = dict((name, i + 2) for i, name in enumerate("abcde"))
+    for expr, new_expr in zip(exprs, result):
+        assert evaluate(expr, context) == evaluate(new_expr, context)
+
+    # the whole shared part becomes a single CSE
+    terms = tuple(var("t%d" % i) for i in range(200))
+    exprs = [prim.Sum(terms + (d,)), prim.Sum(terms + (e,))]
+    result, ops_saved = tag_common_partial_subexpressions(exprs)
+    assert ops_saved == 199
+    for expr, new_expr in zip(exprs, result):
+        cse, = [child for child in new_expr.children
+                if isinstance(child, prim.CommonSubexpression)]
+        assert set(cse.child.children) == set(terms)
+        assert set(new_expr.children) == set([cse, expr.children[-1]])
+
+
+def test_imperative_cse():
+    from pymbolic import var, parse
+    from pymbolic.imperative.statement import Assignment
+    from pymbolic.imperative.transform import eliminate_common_subexpressions
+
+    stmts = [
+            Assignment(var("a"), parse("x+y"), id="s0"),
+            Assignment(var("b"), parse("y+x"), id="s1"),
+            Assignment(var("x"), 1, id="s2"),
+            Assignment(var("c"), parse("x+y"), id="s3"),
+            Assignment(var("d"), parse("2*(x+y)"), id="s4"),
+            Assignment(var("e"), parse("x+y"), id="s5"),
+            ]
+
+    new_stmts = eliminate_common_subexpressions(stmts)
+    assert [stmt.rhs for stmt in new_stmts] == [
+            parse("x+y"), var("a"), 1, parse("x+y"), parse("2*(x+y)"),
+            var("c")]
+    assert new_stmts[1].depends_on == frozenset(["s0"])
+    assert new_stmts[5].depends_on == frozenset(["s3"])
+
+
+def test_imperative_dead_code_and_dep_reduction():
+    from pymbolic import var, parse
+    from pymbolic.imperative.statement import Assignment, Nop
+    from pymbolic.imperative.transform import (
+            eliminate_dead_statements, remove_redundant_dependencies)
+
+    stmts = [
+            Assignment(var("a"), parse("x+1"), id="s0"),
+            Assignment(var("tmp"), parse("a*2"), id="s1", depends_on=["s0"]),
+            Assignment(var("b"), parse("a*3"), id="s2", depends_on=["s0", "s1"]),
+            Assignment(var("c"), parse("b+a"), id="s3",
+                depends_on=["s0", "s1", "s2"]),
+            Nop(id="end", depends_on=["s3", "s1"]),
+            ]
+
+    live_stmts = eliminate_dead_statements(stmts, ["c"])
+    assert [stmt.id for stmt in live_stmts] == ["s0", "s2", "s3", "end"]
+    assert live_stmts[1].depends_on == frozenset(["s0"])
+    assert live_stmts[3].depends_on == frozenset(["s3", "s0"])
+
+    reduced = remove_redundant_dependencies(stmts)
+    assert [stmt.depends_on for stmt in reduced] == [
+            frozenset(), frozenset(["s0"]), frozenset(["s1"]),
+            frozenset(["s2"]), frozenset(["s3"])]
+
+    with pytest.raises(ValueError):
+        remove_redundant_dependencies([
+            Nop(id="s0", depends_on=["s1"]),
+            Nop(id="s1", depends_on=["s0"])])
+
+    # a long chain in which each statement also depends on the one before
+    # its predecessor
+    nstmts = 3000
+    chain = [
+            Nop(id="c%d" % i,
+                depends_on=["c%d" % j for j in [i-1, i-2] if j >= 0])
+            for i in range(nstmts)]
+    reduced = remove_redundant_dependencies(chain)
+    assert [stmt.depends_on for stmt in reduced[1:]] == [
+            frozenset(["c%d" % (i-1)]) for i in range(1, nstmts)]
+
+
+def test_imperative_schedule():
+    from pymbolic import var, parse
+    from pymbolic.imperative.statement import Assignment
+    from pymbolic.imperative.schedule import (
+            get_wavefronts, get_critical_path)
+
+    stmts = [
+            Assignment(var("d"), parse("a*b*c"), id="s3", depends_on=["s0"]),
+            Assignment(var("a"), parse("x+1"), id="s0"),
+            Assignment(var("b"), parse("y+1"), id="s1"),
+            Assignment(var("c"), parse("a*b"), id="s2", depends_on=["s0", "s1"]),
+            Assignment(var("e"), parse("c+d"), id="s4", depends_on=["s2", "s3"]),
+            ]
+
+    wavefronts = get_wavefronts(stmts)
+    assert [[stmt.id for stmt in wf] for wf in wavefronts] == [
+            ["s0", "s1"], ["s3", "s2"], ["s4"]]
+
+    total_cost, path = get_critical_path(stmts)
+    assert total_cost == 4
+    assert path == ["s0", "s3", "s4"]
+
+
+@pytest.mark.parametrize("max_workers", [None, 4])
+def test_imperative_execution(max_workers):
+    np = pytest.importorskip("numpy")
+
+    from pymbolic import var, parse
+    from pymbolic.imperative.statement import (
+            Assignment, ConditionalAssignment, Nop)
+    from pymbolic.imperative.execution import StatementExecutor
+
+    stmts = [
+            Assignment(var("a"), parse("2*x"), id="s0"),
+            Assignment(var("b"), parse("numpy.sin(x)"), id="s1"),
+            Assignment(parse("out[0]"), parse("a+b"), id="s2",
+                depends_on=["s0", "s1"]),
+            ConditionalAssignment(lhs=var("c"), rhs=parse("f(a)"), id="s3",
+                condition=parse("n > 5"), depends_on=["s0"]),
+            Nop(id="end", depends_on=["s2", "s3"]),
+            ]
+
+    executor = StatementExecutor(
+            stmts, functions={"f": lambda v: -v}, max_workers=max_workers)
+
+    x = np.linspace(0, 1, 10)
+    out = np.empty((1, 10))
+    result = executor({"x": x, "out": out, "n": 3})
+
+    assert np.allclose(out[0], 2*x + np.sin(x))
+    assert "c" not in result
+    assert set(executor.timings) == set(stmt.id for stmt in stmts)
+
+    result = executor({"x": x, "out": out, "n": 7})
+    assert np.allclose(result["c"], -2*x)
+
+
+def test_imperative_statement_index():
+    from pymbolic import var, parse
+    from pymbolic.imperative.statement import Assignment
+    from pymbolic.imperative.analysis import (
+            StatementIndex, get_all_used_identifiers)
+    from pymbolic.imperative.transform import disambiguate_and_fuse
+
+    stmts = [
+            Assignment(var("a"), parse("x+1"), id="s0"),
+            Assignment(parse("b[i]"), parse("a*2"), id="s1"),
+            ]
+
+    index = StatementIndex(stmts)
+    assert index.variable_to_writers == {"a": {"s0"}, "b": {"s1"}}
+    assert index.variable_to_readers["a"] == {"s1"}
+    assert index.get_read_variables("s1") == frozenset(["a", "i"])
+    assert get_all_used_identifiers(index) == get_all_used_identifiers(stmts)
+
+    index.replace(Assignment(parse("b[i]"), parse("y*2"), id="s1"))
+    assert "a" not in index.variable_to_readers
+    assert [stmt.id for stmt in index] == ["s0", "s1"]
+
+    index.remove("s0")
+    assert get_all_used_identifiers(index) == set(["b", "i", "y"])
+
+    fused, subst_b, _ = disambiguate_and_fuse(index, stmts)
+    assert [stmt.id for stmt in fused] == ["s1", "s0", "s1_0"]
+    assert set(subst_b) == set(["b", "i"])
+
+    # ids must be present and unique
+    from pymbolic.imperative.transform import eliminate_dead_statements
+    for bad_stmts in [
+            [Assignment(var("a"), 1)],
+            [Assignment(var("a"), 1, id="s"), Assignment(var("b"), 2, id="s")]]:
+        with pytest.raises(ValueError):
+            StatementIndex(bad_stmts)
+        with pytest.raises(ValueError):
+            eliminate_dead_statements(bad_stmts, ["a"])
+
+
+def test_imperative_fuse_many():
+    from pymbolic import var, parse
+    from pymbolic.imperative.statement import Assignment
+    from pymbolic.imperative.transform import disambiguate_and_fuse_many
+
+    def make_stream():
+        return [
+                Assignment(var("tmp"), parse("x+1"), id="compute"),
+                Assignment(var("y"), parse("tmp*2"), id="store",
+                    depends_on=["compute"]),
+                ]
+
+    fused, substs, id_maps = disambiguate_and_fuse_many(
+            [make_stream() for i in range(3)],
+            should_disambiguate_name=lambda name: name != "x")
+
+    assert len(fused) == 6
+    assert len(set(stmt.id for stmt in fused)) == 6
+    assert len(set(stmt.lhs for stmt in fused)) == 6
+    assert substs[0] == {}
+    assert set(substs[2]) == set(["tmp", "y"])
+
+    for stmts, id_map, subst in zip(
+            [fused[0:2], fused[2:4], fused[4:6]], id_maps, substs):
+        assert stmts[1].depends_on == frozenset([id_map["compute"]])
+        assert stmts[0].rhs == parse("x+1")
+        assert stmts[1].rhs == subst.get("tmp", var("tmp"))*2
+
+
+def test_accumulating_dependency_mapper():
+    from pymbolic.mapper.dependency import (
+            DependencyMapper, AccumulatingDependencyMapper)
+
+    expr = parse("sin(x)*a[i+j]**2 + f(y, z=w).attr/CSE(u)")
+    expr = expr + prim.CommonSubexpression(parse("v*a[k]"))
+
+    for flags in [
+            {},
+            dict(include_subscripts=False, include_lookups=False),
+            dict(include_calls="descend_args", include_cses=True),
+            dict(composite_leaves=False),
+            ]:
+        assert (AccumulatingDependencyMapper(**flags)(expr)
+                == DependencyMapper(**flags)(expr))
+
+    # a DAG with 2**100 paths
+    dag = prim.Variable("x")
+    for i in range(100):
+        dag = prim.Sum((dag, dag))
+
+    dep_mapper = AccumulatingDependencyMapper(cache_results=True)
+    assert dep_mapper(dag) == set([prim.Variable("x")])
+    assert dep_mapper(dag) == set([prim.Variable("x")])
+
+
+def test_cached_dependency_mapper():
+    from pymbolic.mapper.dependency import (
+            DependencyMapper, CachedDependencyMapper)
+
+    expr = parse("sin(x)*a[i+j]**2 + f(y, z=w).attr/(u+2)")
+    for flags in [{}, dict(composite_leaves=False)]:
+        assert CachedDependencyMapper(**flags)(expr) == \
+                DependencyMapper(**flags)(expr)
+
+    # results for subexpressions are remembered by the mapper, not the nodes
+    dep_mapper = CachedDependencyMapper()
+    dep_mapper(expr)
+    subexpr = expr.children[1]
+    assert id(subexpr) in dep_mapper.result_cache
+    assert dep_mapper(subexpr) is dep_mapper(subexpr)
+    assert not hasattr(subexpr, "_dependency_cache")
+
+
+def test_constant_folding():
+    from pymbolic.mapper.constant_folder import (
+            ConstantFoldingMapper, CommutativeConstantFoldingMapper)
+    from pymbolic.functions import sin
+    x = prim.Variable("x")
+
+    cfm = CommutativeConstantFoldingMapper()
+    assert cfm(parse("x+1+2*3+(4+x)")) == parse("11+x+x")
+    assert cfm(parse("2*x*3")) == parse("6*x")
+    assert cfm(parse("x**(1+1) + 6//4 + 7%4")) == parse("4 + x**2")
+    assert cfm(sin(2-2) + x) == x
+    assert cfm(prim.If(prim.Comparison(1, "<", 2), x, 5)) == x
+    assert cfm(prim.LogicalOr((x, 1))) is True
+    assert cfm(prim.LogicalAnd((x, 1))) == x
+
+    # failing operations are left alone
+    assert cfm(parse("x/(2-2)")) == prim.Quotient(x, 0)
+    assert cfm(prim.Comparison(1j, "<", 2)) == prim.Comparison(1j, "<", 2)
+    assert cfm(prim.Comparison(3, "<", 2)) is False
+
+    # products are only folded if all factors are constant
+    cfm = ConstantFoldingMapper()
+    assert cfm(prim.Product((2, x, 3))) == prim.Product((2, x, 3))
+    assert cfm(parse("x+2*3")) == parse("6+x")
+
+    # is_constant and evaluate may be overridden
+    class ParameterFoldingMapper(ConstantFoldingMapper):
+        def is_constant(self, expr):
+            from pymbolic.mapper.dependency import DependencyMapper
+            return DependencyMapper()(expr) <= set([prim.Variable("c")])
+
+        def evaluate(self, expr):
+            from pymbolic import evaluate
+            return evaluate(expr, {"c": 2})
+
+    assert ParameterFoldingMapper()(parse("c*3 + x")) == parse("6+x")
+    assert cfm(parse("c*3 + x")) == parse("c*3 + x")
+
+
+def test_simplify():
+    from pymbolic import simplify, evaluate, flatten
+    from pymbolic.mapper.flop_counter import FlopCounter
+
+    assert simplify(parse("x+1+2*3+(4+x)")) == flatten(parse("11 + 2*x"))
+    assert simplify(parse("x*y*x*2 + 3*y*x**2")) == flatten(parse("5*x**2*y"))
+    assert simplify(parse("x - x + (x*y)**2*x")) == flatten(parse("x**3*y**2"))
+    assert simplify(parse("x**a*x**a / (3-2)")) == flatten(parse("x**(2*a)"))
+
+    # repeated factors from splatting (2*x)**1.0 do not merge unlike terms
+    expr = parse("x + (2*x)**0.5*(2*x)**0.5*x")
+    assert simplify(expr) == flatten(parse("x + 2*x**2"))
+    assert evaluate(simplify(expr), {"x": 3}) == 21
+
+    expanded = simplify(
+            parse("(x+1)**3 - (x-1)*(x+1)"), distribute=True)
+    assert expanded == flatten(parse("2 + 3*x + 2*x**2 + x**3"))
+
+    # multiplying this out exceeds the default budget
+    expr = parse("(x+y)**6")
+    assert simplify(expr, distribute=True) == expr
+    assert len(simplify(expr, distribute=True, max_growth=None).children) == 7
+
+    expr = parse("(a*b + 2*(c + a*b)) * (d + d*1) - 2*c*d")
+    result = simplify(expr)
+    assert FlopCounter()(result) < FlopCounter()(expr)
+    context = dict(a=2, b=3, c=5, d=7)
+    assert evaluate(result, context) == evaluate(expr, context)
+
+
+def test_expand_sparse():
+    from pymbolic import expand, evaluate, flatten
+    from pymbolic.mapper.distributor import distribute
+    from pymbolic.mapper.expander import SparsePolynomial
+
+    x = prim.Variable("x")
+
+    x_p = SparsePolynomial.variable(0)
+    y_p = SparsePolynomial.variable(1)
+    assert (x_p + 1)*(x_p - 1) == x_p**2 - 1
+    assert ((x_p + y_p)**2 - x_p*x_p - y_p**2).data == {(1, 1): 2}
+    assert not (x_p - x_p)
+
+    assert expand((x+1)**3) == flatten(parse("x**3 + 3*x**2 + 3*x + 1"))
+    assert expand(parse("(x+y)*(x-y) + y**2")) == x**2
+
+    # subexpressions that are not polynomial are expanded, too
+    assert expand(parse("f((a+1)**2)*(x+1)")) == \
+            flatten(parse("f(a**2 + 2*a + 1)*x + f(a**2 + 2*a + 1)"))
+
+    expr = parse("(a*x+b)*(x+1)")
+    assert expand(expr, parameters=prim.variables("a b")) == \
+            flatten(parse("a*x**2 + (a + b)*x + b"))
+
+    expr = parse("(x + y + 2*z - 1)**4 * (x - 3*z/w)")
+    context = dict(x=0.3, y=-1.2, z=0.7, w=1.5)
+    assert abs(evaluate(expand(expr), context)
+            - evaluate(distribute(expr), context)) < 1e-12
+
+
+def test_distribute_power_of_sum():
+    from pymbolic import evaluate, flatten
+    from pymbolic.mapper.distributor import distribute
+
+    assert distribute(parse("(x+1)**3")) == \
+            flatten(parse("x**3 + 3*x**2 + 3*x + 1"))
+
+    expr = parse("(a*x + y + 1)**12")
+    result = distribute(expr, parameters=set([prim.Variable("a")]))
+    context = dict(a=0.5, x=-0.3, y=0.7)
+    assert abs(evaluate(result, context) / evaluate(expr, context) - 1) < 1e-12
+
+    # non-commutative distribution keeps the order of factors
+    assert distribute(parse("(x+y)**2"), commutative=False) == \
+            flatten(parse("x*x + x*y + y*x + y*y"))
+
+
+def test_term_collector():
+    from pymbolic.mapper.collector import TermCollector
+    from pymbolic import evaluate
+
+    a, x, y = prim.variables("a x y")
+    expr = prim.Sum((
+        prim.Product((2, x, y)),
+        prim.Product((y, 3, x)),
+        prim.Product((x, x, a, 2)),
+        prim.Product((x, prim.Power(x, -1))),
+        prim.Product((a, 4)),
+        5,
+        ))
+
+    tc = TermCollector(parameters=set([a]))
+    result = tc(expr)
+    assert set(result.children) == set([
+            prim.Product((5, x, y)),
+            prim.Product((2, a, prim.Power(x, 2))),
+            prim.Product((4, a)),
+            6,
+            ])
+
+    term, coeff = tc.split_term(prim.Product((3, a, y, x, y)))
+    assert term == frozenset([(x, 1), (y, 2)])
+    assert coeff == prim.Product((3, a))
+
+    # linear in the number of terms
+    expr = prim.Sum(tuple(
+        prim.Product((i % 7, x**(i % 3), y**(i % 5)))
+        for i in range(20000)))
+    context = dict(x=0.3, y=1.1)
+    result = TermCollector()(expr)
+    assert len(result.children) == 15
+    assert abs(evaluate(result, context) - evaluate(expr, context)) < 1e-8
+
+
+def test_polynomial_multiplication():
+    import random
+    from pymbolic.polynomial import Polynomial, _multiply_schoolbook
+
+    x = Polynomial(prim.Variable("x"))
+    y = Polynomial(prim.Variable("y"))
+    rng = random.Random(17)
+
+    def random_poly(base, coeffs):
+        return Polynomial(base.base, tuple(
+            (i, coeff) for i, coeff in enumerate(coeffs) if coeff))
+
+    for n in [5, 30, 300]:
+        # integers (Kronecker substitution)
+        a = random_poly(x, [rng.randint(-10**9, 10**9) for _ in range(n)])
+        b = random_poly(x, [rng.randint(-3, 3) for _ in range(n+7)])
+        assert (a*b).data == _multiply_schoolbook(a.data, b.data)
+
+        # floats (numpy)
+        a = random_poly(x, [rng.uniform(-1, 1) for _ in range(n)])
+        b = random_poly(x, [rng.uniform(-1, 1) for _ in range(2*n)])
+        for (exp, coeff), (ref_exp, ref_coeff) in zip(
+                (a*b).data, _multiply_schoolbook(a.data, b.data)):
+            assert exp == ref_exp
+            assert abs(coeff - ref_coeff) < 1e-10
+
+    # small float coefficients keep their relative precision
+    a = random_poly(x, [0.5**i for i in range(300)])
+    prod_data = (a*a).data
+    assert len(prod_data) == 599
+    for exp, coeff in prod_data:
+        ref_coeff = (min(exp, 598-exp)+1) * 0.5**exp
+        assert abs(coeff - ref_coeff) <= 1e-12*ref_coeff
+
+    # polynomial coefficients (Karatsuba)
+    a = random_poly(x, [rng.randint(0, 3)*y + rng.randint(1, 3)
+        for _ in range(50)])
+    b = random_poly(x, [y - rng.randint(1, 3) for _ in range(40)])
+    assert (a*b).data == _multiply_schoolbook(a.data, b.data)
+
+    # nested polynomials whose products cancel to zero coefficients
+    a = (x+y)**30
+    b = (x-y)**30
+    assert (a*b).data == _multiply_schoolbook(a.data, b.data)
+    assert all(coeff for exp, coeff in (a*b).data)
+
+    assert ((x+1)**2).data == ((0, 1), (1, 2), (2, 1))
+
+
+def test_polynomial_dense_mode():
+    import numpy as np
+    from pymbolic import evaluate
+    from pymbolic.polynomial import Polynomial, differentiate, integrate
+
+    x = prim.Variable("x")
+    xp = Polynomial(x)
+
+    a = Polynomial(x, np.array([1., -2., 0., 4.]))
+    assert a.is_dense
+    assert a.data == ((0, 1.), (1, -2.), (3, 4.))
+    assert a.degree == 3
+    assert a.get_coefficient(3) == 4.
+    assert a.get_coefficient(2) == 0
+    assert a == a.to_sparse()
+    assert not a.to_sparse().is_dense
+
+    # arithmetic with sparse numerical polynomials stays dense
+    b = xp**2 + 3
+    for result in [a + b, a*b, b*a, a - 1, 2*a, -a]:
+        assert result.is_dense
+    assert (a*b).data == (a.to_sparse()*b).data
+    assert (a + b).data == (a.to_sparse() + b).data
+
+    # division treats coefficients as a field
+    quot, rem = divmod(a*b + (xp + 2), b.to_dense())
+    assert quot.is_dense
+    assert np.allclose(quot.DenseData, a.DenseData)
+    assert np.allclose(rem.DenseData, [2, 1])
+
+    for zero in [0, 0., Polynomial(x, np.zeros(3))]:
+        with pytest.raises(ZeroDivisionError):
+            divmod(a, zero)
+
+    assert differentiate(a).data == ((0, -2.), (2, 12.))
+    assert np.allclose(integrate(differentiate(a)).DenseData, [0, -2, 0, 4])
+
+    points = np.linspace(-1, 1, 5)
+    assert np.allclose(evaluate(a, {"x": points}),
+            1 - 2*points + 4*points**3)
+
+    with pytest.raises(ValueError):
+        Polynomial(x, ((0, x),)).to_dense()
+
+
+def test_polynomial_divmod_gcd():
+    from random import Random
+    from pymbolic.algorithm import gcd
+    from pymbolic.polynomial import Polynomial
+
+    x = prim.Variable("x")
+    xp = Polynomial(x)
+
+    quot, rem = divmod(3*xp**3 + 2*xp + 5, xp**2 + 1)
+    assert quot == 3*xp
+    assert rem == 5 - xp
+
+    # integer coefficients: stops once the leading coefficient does not divide
+    quot, rem = divmod(3*xp**3 + 2*xp + 5, 2*xp**2 + 1)
+    assert not quot
+    assert rem == 3*xp**3 + 2*xp + 5
+
+    assert gcd((xp+1)**3*(xp-2), (xp+1)*(xp-2)**2*(xp+5)) == xp**2 - xp - 2
+    assert gcd(6*xp**2 + 12*xp + 6, 4*xp + 4) == 2*xp + 2
+    assert gcd(xp**3*(xp+1), xp**2) == xp**2
+    assert gcd(-xp - 1, 0*xp) == xp + 1
+    assert gcd(xp**2 + 1, xp + 1) == Polynomial(x, ((0, 1),))
+
+    rng = Random(17)
+
+    def random_monic_poly(degree):
+        return Polynomial(x, tuple(
+            (i, rng.randint(-10**6, 10**6)) for i in range(degree)
+            ) + ((degree, 1),))
+
+    g, a, b = [random_monic_poly(60) for i in range(3)]
+
+    quot, rem = divmod(a*g, g)
+    assert not rem
+    assert not quot - a
+
+    assert not gcd(a*g, b*g) - g
+
+
+def test_polynomial_evaluate_batch():
+    import numpy as np
+    from pymbolic import evaluate
+    from pymbolic.polynomial import Polynomial, evaluate_batch
+
+    x = Polynomial(prim.Variable("x"))
+    y = Polynomial(prim.Variable("y"))
+
+    xs = np.linspace(-1, 1, 101)
+    ys = np.linspace(0, 2, 101)
+
+    p = (x + y + 1)**5
+    ref = (xs + ys + 1)**5
+    assert np.allclose(evaluate_batch(p, {"x": xs, "y": ys}), ref)
+    assert np.allclose(
+            evaluate_batch(p, {"x": xs, "y": ys}, block_size=16), ref)
+    assert np.allclose(evaluate(p, {"x": xs, "y": ys}), ref)
+
+    # broadcasting
+    grid = evaluate_batch(p, {"x": xs, "y": ys[:, np.newaxis]})
+    assert grid.shape == (101, 101)
+    assert np.allclose(grid, (xs + ys[:, np.newaxis] + 1)**5)
+
+    q = 3*x**7 + 2.5j*x**2
+    assert np.allclose(
+            evaluate_batch(q, {"x": xs}, block_size=10),
+            3*xs**7 + 2.5j*xs**2)
+    assert evaluate_batch(q, {"x": 2}) == 3*2**7 + 10j
+
+    # results are shaped like the input, even for constant polynomials
+    const = Polynomial(x.base, ((0, 3),))
+    for block_size in [1000, 10]:
+        result = evaluate_batch(const, {"x": xs}, block_size=block_size)
+        assert result.shape == xs.shape
+        assert (result == 3).all()
+
+
+def test_polynomial_sparse_storage():
+    import numpy as np
+    from pymbolic.polynomial import Polynomial
+
+    x = prim.Variable("x")
+    xp = Polynomial(x)
+
+    a = Polynomial(x, ((0, 1), (2, 3), (5, -2), (9, 4)))
+    assert a.get_coefficient(5) == -2
+    assert a.get_coefficient(9) == 4
+    assert a.get_coefficient(3) == 0
+    assert a.get_coefficient(10) == 0
+    assert a.coefficients() == [1, 3, -2, 4]
+
+    assert (a + 2).data == ((0, 3), (2, 3), (5, -2), (9, 4))
+    assert (a - 1).data == ((2, 3), (5, -2), (9, 4))
+    assert (a + 7*xp**3).data == ((0, 1), (2, 3), (3, 7), (5, -2), (9, 4))
+    assert (a + xp**12).data == a.data + ((12, 1),)
+    assert (a + (2*xp**5 + xp**2)).data == ((0, 1), (2, 4), (9, 4))
+    assert not a - a
+    assert (a*3).data == ((0, 3), (2, 9), (5, -6), (9, 12))
+
+    assert a.slice_degrees(2, 9).data == ((2, 3), (5, -2))
+    assert a.slice_degrees(stop=3).data == ((0, 1), (2, 3))
+    assert a.slice_degrees(start=6).data == ((9, 4),)
+    assert a.slice_degrees(10) == Polynomial(x, ())
+
+    dense = a.to_dense()
+    assert dense.slice_degrees(2, 9).is_dense
+    assert np.array_equal(dense.slice_degrees(2, 9).DenseData, [0, 0, 3, 0, 0, -2])
+
+
+@pytest.mark.parametrize("method", ["bareiss", "modular"])
+def test_gaussian_elimination(method):
+    import numpy as np
+    from pymbolic.algorithm import gaussian_elimination
+
+    mat = np.array([
+        [2, 4, -2],
+        [1, 2, 3],
+        [4, 8, 0],
+        ])
+    rhs = np.array([[2], [5], [6]])
+
+    mat, rhs = gaussian_elimination(mat, rhs, method=method)
+    assert mat.dtype == object
+    assert np.array_equal(mat, [[1, 2, 0], [0, 0, 1], [0, 0, 0]])
+    # the last row records an inconsistency
+    assert np.array_equal(rhs, [[2], [1], [1]])
+
+    # entries outgrow 64-bit integers
+    rng = np.random.RandomState(12)
+    mat = rng.randint(-10**6, 10**6, size=(12, 12))
+    rhs = rng.randint(-10**6, 10**6, size=(12, 2))
+    red_mat, red_rhs = gaussian_elimination(mat, rhs, method=method)
+
+    pivots = red_mat.diagonal()
+    assert np.array_equal(red_mat, np.diag(pivots))
+
+    from functools import reduce
+    from pymbolic.algorithm import lcm
+    pivot_lcm = reduce(lcm, pivots)
+    solution = red_rhs * (pivot_lcm // pivots)[:, np.newaxis]
+    assert np.array_equal(
+            mat.astype(object).dot(solution), pivot_lcm*rhs.astype(object))
+
+    # entries that fit into 64-bit integers, but whose products do not
+    for _ in range(20):
+        mat = rng.randint(-2**40, 2**40, size=(4, 4), dtype=np.int64)
+        rhs = rng.randint(-2**40, 2**40, size=(4, 1), dtype=np.int64)
+        red_mat, red_rhs = gaussian_elimination(mat, rhs, method=method)
+        ref_mat, ref_rhs = gaussian_elimination(
+                mat.astype(object), rhs.astype(object), method="modular")
+        assert np.array_equal(red_mat, ref_mat)
+        assert np.array_equal(red_rhs, ref_rhs)
+
+    # empty systems
+    for shape, rhs_shape in [((0, 3), (0, 1)), ((2, 0), (2, 0))]:
+        red_mat, red_rhs = gaussian_elimination(
+                np.zeros(shape, dtype=int), np.zeros(rhs_shape, dtype=int),
+                method=method)
+        assert red_mat.shape == shape
+        assert red_rhs.shape == rhs_shape
+
+
+@pytest.mark.parametrize("method", ["dense", "sparse", None])
+def test_solve_affine_equations_for(method):
+    from pymbolic.algorithm import solve_affine_equations_for
+
+    i, j, k, n, m = [prim.Variable(name) for name in "ijknm"]
+
+    result = solve_affine_equations_for(["i", "j", "k"], [
+        (i + 2*j, n + 3),
+        (j, m - 1),
+        (2*k + 2*i, 2*n + j + j),
+        (i + j, n + 4 - m),  # redundant
+        ], method=method)
+
+    from pymbolic import expand
+    assert expand(result[i] - (n + 5 - 2*m)) == 0
+    assert expand(result[j] - (m - 1)) == 0
+    assert expand(result[k] - (3*m - 6)) == 0
+
+    with pytest.raises(RuntimeError, match="overdetermined"):
+        solve_affine_equations_for(["i"], [(i, n), (i, n + 1)], method=method)
+    with pytest.raises(RuntimeError, match="uniquely"):
+        solve_affine_equations_for(["i", "j"], [(i + j, n)], method=method)
+    with pytest.raises(RuntimeError, match="uniquely"):
+        solve_affine_equations_for(["i"], [], method=method)
+    with pytest.raises(RuntimeError, match="remainder"):
+        solve_affine_equations_for(["i"], [(2*i, n)], method=method)
+
+    # unknowns on both sides
+    assert solve_affine_equations_for(
+            ["i"], [(i + 1, 2*i - n)], method=method)[i] == 1 + n
+
+
+def test_solve_affine_equations_for_sparse_vs_dense():
+    import random
+    from pymbolic.algorithm import solve_affine_equations_for
+
+    rng = random.Random(0)
+    p, q = prim.Variable("p"), prim.Variable("q")
+
+    for _ in range(100):
+        nunknowns = rng.randint(2, 6)
+        unknowns = [prim.Variable("u%d" % i) for i in range(nunknowns)]
+        solution = [
+                rng.randint(-3, 3) + rng.randint(-2, 2)*p + rng.randint(-2, 2)*q
+                for _ in range(nunknowns)]
+
+        equations = []
+        for _ in range(nunknowns + rng.randint(0, 2)):
+            coeffs = [rng.choice([0, 0, 0, 1, -1, 2, 3])
+                    for _ in range(nunknowns)]
+            equations.append((
+                sum(c*u for c, u in zip(coeffs, unknowns)),
+                sum(c*s for c, s in zip(coeffs, solution))))
+
+        results = []
+        for method in ["dense", "sparse"]:
+            try:
+                results.append(solve_affine_equations_for(
+                    [u.name for u in unknowns], equations, method=method))
+            except RuntimeError as e:
+                results.append(str(e))
+
+        assert results[0] == results[1]
+
+
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1: